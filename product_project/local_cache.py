@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from django.conf import settings
+
+
+class LocalCache:
+    """
+    Process-local cache in front of shared one. It is cleared only in the process which changed data,
+    so its entries live a lot shorter than shared ones; size is bounded by evicting the least recently used entries.
+    Lifetime and size are read from indicated settings on each write
+    """
+
+    def __init__(self, timeout_setting: str, size_setting: str) -> None:
+        self.timeout_setting: str = timeout_setting
+        self.size_setting: str = size_setting
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str, now: float = None) -> Any | None:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            cached: tuple | None = self.entries.get(key)
+            if not cached:
+                return None
+
+            if cached[0] <= now:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return cached[1]
+
+    def set(self, key: str, value: Any, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.entries[key] = (now + getattr(settings, self.timeout_setting), value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > getattr(settings, self.size_setting):
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,26 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# enabled only by read-only API actions, so writes, celery tasks and scripts always use primary database
+use_replica: ContextVar[bool] = ContextVar('use_replica', default=False)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints) -> str:
+        if use_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+
+        return 'default'
+
+    def db_for_write(self, model, **hints) -> str:
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # replicas contain the same data as primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool:
+        return db == 'default'
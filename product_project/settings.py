@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from celery.schedules import crontab
@@ -17,8 +18,12 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 
 AUTH_TOKEN = os.getenv('AUTH_TOKEN')
 
+# load testing harness (scripts/load_test.py) and server started by it are run with LOAD_TEST=1,
+# so they use dedicated database and cache and run the same way as in production
+LOAD_TEST = os.getenv('LOAD_TEST') == '1'
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not LOAD_TEST
 
 ALLOWED_HOSTS = [
     '127.0.0.1'
@@ -38,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_swagger',
     'rest_framework.authtoken',
@@ -61,6 +67,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if not DEBUG:
+    INSTALLED_APPS.remove('debug_toolbar')
+    MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'product_project.urls'
 
 TEMPLATES = [
@@ -97,10 +107,40 @@ DATABASES = {
     }
 }
 
+# dedicated database of load testing harness, which seeds and clears it
+LOAD_TEST_DB_NAME = os.getenv('LOAD_TEST_DB_NAME')
+
+if LOAD_TEST:
+    DATABASES['default']['NAME'] = LOAD_TEST_DB_NAME
+
+# read-only replicas of primary database, hosts are separated by comma
+DATABASE_REPLICAS = []
+
+# load test is run against its single database
+DB_REPLICA_HOSTS = '' if LOAD_TEST else os.getenv('DB_REPLICA_HOSTS', '')
+
+for index, replica_host in enumerate(filter(None, DB_REPLICA_HOSTS.split(','))):
+    DATABASE_REPLICAS.append(f'replica_{index}')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['product_project.routers.PrimaryReplicaRouter']
+
+# seconds during which user reads from primary after his write
+REPLICA_STICKINESS_SECONDS = 10
+
+# load test uses separate Redis database if it is given and its own prefix anyway, so catalog versions
+# and cached products of application are neither read nor changed by it
+LOAD_TEST_REDIS_URL = os.getenv('LOAD_TEST_REDIS_URL')
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
-        "LOCATION": os.getenv('REDIS_URL')
+        "LOCATION": (LOAD_TEST and LOAD_TEST_REDIS_URL) or os.getenv('REDIS_URL'),
+        "KEY_PREFIX": 'load-test' if LOAD_TEST else '',
     }
 }
 
@@ -125,7 +165,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -133,6 +173,16 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# lifetime of token to user resolution in shared cache and in memory of every process
+AUTH_TOKEN_CACHE_SECONDS = int(os.getenv('AUTH_TOKEN_CACHE_SECONDS', 300))
+AUTH_TOKEN_LOCAL_CACHE_SECONDS = int(os.getenv('AUTH_TOKEN_LOCAL_CACHE_SECONDS', 5))
+AUTH_TOKEN_LOCAL_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_LOCAL_CACHE_SIZE', 10000))
+
+# lifetime of serialized products returned by retrieve in shared cache and in memory of every process
+PRODUCT_CACHE_SECONDS = int(os.getenv('PRODUCT_CACHE_SECONDS', 600))
+PRODUCT_LOCAL_CACHE_SECONDS = int(os.getenv('PRODUCT_LOCAL_CACHE_SECONDS', 5))
+PRODUCT_LOCAL_CACHE_SIZE = int(os.getenv('PRODUCT_LOCAL_CACHE_SIZE', 10000))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -155,6 +205,36 @@ MEDIA_ROOT = 'media/'
 
 MEDIA_URL = os.path.join(BASE_DIR, '/media/')
 
+# 'X-Accel-Redirect' for nginx or 'X-Sendfile' for apache/lighttpd, if not set files are streamed by django
+MEDIA_SENDFILE_HEADER = os.getenv('MEDIA_SENDFILE_HEADER')
+
+# internal location of nginx which points to MEDIA_ROOT
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# change events of products and images are delivered from outbox table to Redis stream
+OUTBOX_PUBLISHER = os.getenv('OUTBOX_PUBLISHER', 'products.outbox.RedisStreamPublisher')
+OUTBOX_REDIS_URL = (LOAD_TEST and LOAD_TEST_REDIS_URL) or os.getenv('OUTBOX_REDIS_URL', os.getenv('REDIS_URL'))
+OUTBOX_STREAM = f'{"load-test:" if LOAD_TEST else ""}{os.getenv("OUTBOX_STREAM", "products:events")}'
+OUTBOX_STREAM_MAX_LENGTH = int(os.getenv('OUTBOX_STREAM_MAX_LENGTH', 1000000))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 1000))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', 7))
+
+# how long in-memory index of known barcodes awaits missing change of barcodes before it is rebuilt
+BARCODE_INDEX_REBUILD_SECONDS = int(os.getenv('BARCODE_INDEX_REBUILD_SECONDS', 60))
+# index is rebuilt in background thread, otherwise request which finds it stale waits for rebuilding;
+# it is turned on in tests, where background thread could not share test database
+BARCODE_INDEX_SYNC_REBUILD = os.getenv('BARCODE_INDEX_SYNC_REBUILD') == '1'
+
+# directory with columnar snapshot of remote catalog, it has to be shared by web and celery processes
+REMOTE_SNAPSHOT_DIR = os.getenv('REMOTE_SNAPSHOT_DIR', BASE_DIR / 'snapshots')
+
+# server started by load testing harness, {port} and {workers} are substituted; by default it is run
+# the same way as in production with WEB_CONCURRENCY workers
+LOAD_TEST_SERVER_COMMAND = os.getenv(
+    'LOAD_TEST_SERVER_COMMAND', 'gunicorn product_project.wsgi:application --bind 127.0.0.1:{port} --workers {workers}'
+)
+LOAD_TEST_SERVER_WORKERS = int(os.getenv('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -162,9 +242,62 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+# Queues:
+# - 'db' (default) for DB-bound tasks, served by prefork pool with concurrency about amount of CPUs
+#   and prefetch 1, so long product updates do not hold other tasks:
+#   celery -A product_project worker -Q db -P prefork -c 4 --prefetch-multiplier 1 -l info
+# - 'io' for network-bound downloading and hashing of images and for work with media files, served by threads
+#   (or gevent) pool with high concurrency, as workers mostly wait for responses. Tasks which write a row
+#   per image, like update_certain_images, stay on 'db', so they do not hold many connections at once:
+#   celery -A product_project worker -Q io -P threads -c 50 --prefetch-multiplier 4 -l info
+CELERY_TASK_DEFAULT_QUEUE = 'db'
+
+CELERY_TASK_ROUTES = {
+    'products.tasks.update_images_batch': {'queue': 'io'},
+    'products.tasks.verify_images': {'queue': 'io'},
+    'products.tasks.backfill_image_metadata': {'queue': 'io'},
+    'products.tasks.delete_media_files': {'queue': 'io'},
+    'products.tasks.collect_orphaned_media': {'queue': 'io'},
+    'scripts.benchmark_queues.benchmark_image_task': {'queue': 'io'},
+}
+
+# tasks of benchmark_queues script are kept out of application modules, but workers have to know them
+CELERY_IMPORTS = ['scripts.benchmark_queues']
+
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# 'daily' renews the whole catalog at once, 'sharded' splits barcodes into RENEW_SHARD_COUNT shards
+# and renews one shard every RENEW_SHARD_INTERVAL_MINUTES, so the whole catalog is renewed once per cycle
+RENEW_MODE = os.getenv('RENEW_MODE', 'daily')
+RENEW_SHARD_COUNT = int(os.getenv('RENEW_SHARD_COUNT', 24))
+RENEW_SHARD_INTERVAL_MINUTES = int(os.getenv('RENEW_SHARD_INTERVAL_MINUTES', 60))
+# amount of simultaneous requests to remote API while renewing single shard and barcodes per request
+RENEW_SHARD_CONCURRENCY = int(os.getenv('RENEW_SHARD_CONCURRENCY', 4))
+RENEW_REQUEST_CHUNK_SIZE = int(os.getenv('RENEW_REQUEST_CHUNK_SIZE', 500))
+# random delay of shard start, it has to be less than interval
+RENEW_SHARD_JITTER_SECONDS = int(os.getenv('RENEW_SHARD_JITTER_SECONDS', 300))
+
 CELERY_BEAT_SCHEDULE = {
     'renewing_database': {
         'task': 'products.tasks.renew_database',
         'schedule': crontab(minute=0, hour=10)
-    }
+    },
+    'verifying_images': {
+        'task': 'products.tasks.verify_images',
+        'schedule': crontab(minute=30)
+    },
+    'collecting_orphaned_media': {
+        'task': 'products.tasks.collect_orphaned_media',
+        'schedule': crontab(minute=0, hour=4)
+    },
+    'publishing_outbox_events': {
+        'task': 'products.tasks.publish_outbox_events',
+        'schedule': timedelta(seconds=5)
+    },
 }
+
+if RENEW_MODE == 'sharded':
+    CELERY_BEAT_SCHEDULE['renewing_database'] = {
+        'task': 'products.tasks.renew_next_shard',
+        'schedule': timedelta(minutes=RENEW_SHARD_INTERVAL_MINUTES)
+    }
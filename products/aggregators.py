@@ -1,8 +1,10 @@
 from typing import Type
 
+from django.db import connections, router
 from django.db.models import F, Model, OuterRef, Q, Subquery
 
-from products.enums import ComparisonModelEnum
+from products.enums import ComparisonModelEnum, ProductEnum
+from products.models import Product, ProductModelMixin, ProductRemote
 
 
 class BaseAggregator:
@@ -30,6 +32,10 @@ class BaseAggregator:
             auxiliary_model: Type[Model] = self.comparison_model_enum.get_comparison_model(model)
             auxiliary_model_name: str = auxiliary_model.__name__.lower()
 
+            # fields with stored fingerprints of field groups
+            model_field_names: set = {field.name for field in model._meta.get_fields()}
+            core_fields: list = self.comparison_model_enum.get_core_fields(model)
+
             # iterate over each field of certain type
             for type_name, field_names in dct.items():
 
@@ -37,20 +43,35 @@ class BaseAggregator:
                 query_conditions = Q()
                 if not self.exclusion.get(type_name, None):
                     self.exclusion[type_name] = []
+
+                # if group has fingerprint, equal fingerprints are enough for excluding, so separate fields
+                # are compared only for rows that really changed
+                fingerprint_name = f'{type_name}_fingerprint'
+                if fingerprint_name in model_field_names:
+                    self.annotations[model][f'{auxiliary_model_name}__{fingerprint_name}'] = Subquery(
+                        auxiliary_model.objects
+                        .filter(**{key: OuterRef(key) for key in core_fields})
+                        .values(fingerprint_name)[:1]
+                    )
+
                 for name in field_names:
 
                     # adding conditions of certain field for excluding
                     query_conditions.add(Q(**{f'{name}': F(f'{auxiliary_model_name}__{name}')}), Q.AND)
 
                     # constructing Subquery for correct seeking and further exclusion
-                    core_fields: list = self.comparison_model_enum.get_core_fields(model)
                     self.annotations[model][f'{auxiliary_model_name}__{name}'] = Subquery(
                             auxiliary_model.objects
                             .filter(**{key: OuterRef(key) for key in core_fields})
                             .values(name)[:1]
                         )
 
-                self.exclusion[type_name].append(query_conditions)
+                if fingerprint_name in model_field_names:
+                    self.exclusion[type_name].append(
+                        Q(**{fingerprint_name: F(f'{auxiliary_model_name}__{fingerprint_name}')})
+                    )
+                else:
+                    self.exclusion[type_name].append(query_conditions)
 
     @property
     def response(self) -> dict[str, dict | list]:
@@ -58,3 +79,88 @@ class BaseAggregator:
             'annotations': self.annotations,
             'exclusions': self.exclusion
         }
+
+
+class SummaryAggregator:
+    """
+    Counts products that differ in each field group with single aggregate query over join of
+    local and remote products. Stored fingerprints of field groups are compared where they exist
+    """
+    model: Type[ProductModelMixin] = Product
+    auxiliary_model: Type[ProductModelMixin] = ProductRemote
+    fields_enum: Type[ProductEnum] = ProductEnum
+
+    # maximal amount of sample values for each field group
+    max_samples: int = 20
+
+    def __init__(self, groups: list[str], values: list | None = None, samples: int = 0) -> None:
+        self.groups: list[str] = groups
+        self.values: list | None = values
+        self.samples: int = min(samples, self.max_samples)
+
+        self.connection = connections[router.db_for_read(self.model)]
+        self.model_field_names: set = {field.name for field in self.model._meta.fields}
+
+    def get_column(self, alias: str, model: Type[Model], field_name: str) -> str:
+        return f'{alias}.{self.connection.ops.quote_name(model._meta.get_field(field_name).column)}'
+
+    def get_condition(self, group: str) -> str:
+        fingerprint_name = f'{group}_fingerprint'
+        if fingerprint_name in self.model_field_names:
+            field_names: tuple = (fingerprint_name,)
+        else:
+            field_names: tuple = self.fields_enum[group].value[0]
+
+        return '(' + ' OR '.join(
+            f'{self.get_column("p", self.model, name)} IS DISTINCT FROM '
+            f'{self.get_column("r", self.auxiliary_model, name)}'
+            for name in field_names
+        ) + ')'
+
+    def get_from_clause(self) -> tuple[str, list]:
+        value_column: str = self.get_column('p', self.model, 'value')
+        sql: str = (
+            f'FROM {self.connection.ops.quote_name(self.model._meta.db_table)} p '
+            f'INNER JOIN {self.connection.ops.quote_name(self.auxiliary_model._meta.db_table)} r '
+            f'ON {self.get_column("r", self.auxiliary_model, "value")} = {value_column}'
+        )
+
+        if not self.values:
+            return sql + ' WHERE 1 = 1', []
+
+        # the whole list of values is passed as single array on PostgreSQL
+        if self.connection.vendor == 'postgresql':
+            return sql + f' WHERE {value_column} = ANY(%s::text[])', [[str(value) for value in self.values]]
+
+        return sql + f' WHERE {value_column} IN ({", ".join(["%s"] * len(self.values))})', list(self.values)
+
+    def get_counts(self) -> dict[str, int]:
+        from_clause, params = self.get_from_clause()
+        counts_sql: str = ', '.join(
+            f'COUNT(*) FILTER (WHERE {self.get_condition(group)})' for group in self.groups
+        )
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT {counts_sql} {from_clause}', params)
+            row: tuple = cursor.fetchone()
+
+        return dict(zip(self.groups, row))
+
+    def get_samples(self, group: str) -> list[str]:
+        from_clause, params = self.get_from_clause()
+        sql: str = f'SELECT {self.get_column("p", self.model, "value")} {from_clause} ' \
+                   f'AND {self.get_condition(group)} LIMIT %s'
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, [*params, self.samples])
+            return [row[0] for row in cursor.fetchall()]
+
+    @property
+    def response(self) -> dict[str, dict]:
+        response: dict = {group: {'count': count} for group, count in self.get_counts().items()}
+
+        if self.samples > 0:
+            for group in self.groups:
+                response[group]['samples'] = self.get_samples(group)
+
+        return response
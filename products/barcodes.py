@@ -0,0 +1,247 @@
+import threading
+import time
+from typing import Iterable
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from products.functions import filter_by_values
+from products.models import Product, ProductRemote
+
+# version of known barcodes, it is incremented by each change of them
+BARCODE_INDEX_VERSION_KEY = 'products:barcode-index-version'
+# added and removed barcodes of each version, processes apply them to their indexes instead of rebuilding
+BARCODE_INDEX_CHANGE_KEY = 'products:barcode-index-change:{version}'
+BARCODE_INDEX_CHANGE_SECONDS = 60 * 60
+
+# if index is behind by more changes, it is rebuilt instead of applying them
+MAX_APPLIED_CHANGES = 1000
+
+
+class BarcodeIndex:
+    """
+    Sorted arrays of local and remote barcodes, membership is checked with binary search. Barcodes are kept
+    as bytes, which takes four times less memory than numpy unicode strings
+    """
+
+    def __init__(self, version: int, local: np.ndarray, remote: np.ndarray) -> None:
+        self.version: int = version
+        self.built_at: float = time.monotonic()
+        self.local: np.ndarray = local
+        self.remote: np.ndarray = remote
+
+    @classmethod
+    def from_values(cls, version: int, local_values, remote_values) -> 'BarcodeIndex':
+        return cls(version, cls.to_array(local_values), cls.to_array(remote_values))
+
+    @staticmethod
+    def to_array(values) -> np.ndarray:
+        encoded: list[bytes] = [str(value).encode() for value in values]
+        return np.unique(np.array(encoded, dtype=bytes)) if encoded else np.array([], dtype=bytes)
+
+    @staticmethod
+    def contains(sorted_values: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        if not len(sorted_values):
+            return np.zeros(len(keys), dtype=bool)
+
+        positions: np.ndarray = np.minimum(np.searchsorted(sorted_values, keys), len(sorted_values) - 1)
+        return sorted_values[positions] == keys
+
+    @classmethod
+    def change_array(cls, sorted_values: np.ndarray, states: dict[str, bool]) -> np.ndarray:
+        # states tell whether value is present after the change
+        removed: np.ndarray = cls.to_array(value for value, present in states.items() if not present)
+        added: np.ndarray = cls.to_array(value for value, present in states.items() if present)
+        if len(removed):
+            sorted_values = sorted_values[~cls.contains(removed, sorted_values)]
+        return np.union1d(sorted_values, added) if len(added) else sorted_values
+
+    def apply(self, version: int, cleared: bool, local_states: dict, remote_states: dict) -> 'BarcodeIndex':
+        """
+        Returns new index with applied changes, the current one stays unchanged for threads which use it
+        """
+        local, remote = (self.local[:0], self.remote[:0]) if cleared else (self.local, self.remote)
+        return BarcodeIndex(version, self.change_array(local, local_states), self.change_array(remote, remote_states))
+
+    def split(self, values: list[str]) -> tuple[list[str], list[str]]:
+        """
+        Returns values which exist both in local and remote catalog and the rest of values
+        """
+        if not values:
+            return [], []
+
+        keys: np.ndarray = np.array([str(value).encode() for value in values], dtype=bytes)
+        known: np.ndarray = self.contains(self.local, keys) & self.contains(self.remote, keys)
+        return (
+            [value for value, is_known in zip(values, known) if is_known],
+            [value for value, is_known in zip(values, known) if not is_known]
+        )
+
+
+barcode_index: BarcodeIndex | None = None
+barcode_index_lock = threading.Lock()
+# held while index is rebuilt in background, so only one rebuild of process runs at once
+barcode_index_rebuild_lock = threading.Lock()
+
+
+def get_barcode_index_version() -> int:
+    version = cache.get(BARCODE_INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(BARCODE_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(BARCODE_INDEX_VERSION_KEY)
+    return version
+
+
+def publish_barcode_change(change: dict) -> None:
+    get_barcode_index_version()
+    try:
+        version: int = cache.incr(BARCODE_INDEX_VERSION_KEY)
+    except ValueError:
+        # version was evicted, processes are far behind the new one and rebuild their indexes
+        cache.set(BARCODE_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+        return
+
+    cache.set(BARCODE_INDEX_CHANGE_KEY.format(version=version), change, BARCODE_INDEX_CHANGE_SECONDS)
+
+
+def record_barcode_changes(added: Iterable[str] = (), removed: Iterable[str] = (), remote: bool = False) -> None:
+    """
+    Publishes added and removed barcodes of local or remote catalog after the current transaction is committed,
+    indexes of all processes apply them on their next use
+    """
+    states: dict = {str(value): False for value in removed if value is not None}
+    states.update({str(value): True for value in added if value is not None})
+    if states:
+        transaction.on_commit(lambda: publish_barcode_change({'remote' if remote else 'local': states}))
+
+
+def clear_barcode_index() -> None:
+    """
+    Marks all barcodes as removed, indexes of all processes are emptied without querying database
+    """
+    transaction.on_commit(lambda: publish_barcode_change({'cleared': True}))
+
+
+def bump_barcode_index_version() -> None:
+    """
+    Marks barcodes as changed without known values, indexes of all processes are rebuilt in background
+    """
+    transaction.on_commit(lambda: publish_barcode_change({'rebuild': True}))
+
+
+def build_barcode_index() -> BarcodeIndex:
+    global barcode_index
+
+    # changes made while database is read are applied again afterwards, which does not change the result
+    version: int = get_barcode_index_version()
+    index: BarcodeIndex = BarcodeIndex.from_values(
+        version,
+        Product.objects.values_list('value', flat=True).iterator(),
+        ProductRemote.objects.values_list('value', flat=True).iterator()
+    )
+    with barcode_index_lock:
+        barcode_index = index
+    return index
+
+
+def rebuild_barcode_index() -> None:
+    try:
+        build_barcode_index()
+    finally:
+        connection.close()
+        barcode_index_rebuild_lock.release()
+
+
+def start_barcode_index_rebuild() -> None:
+    if barcode_index_rebuild_lock.acquire(blocking=False):
+        threading.Thread(target=rebuild_barcode_index, daemon=True).start()
+
+
+def apply_barcode_changes(index: BarcodeIndex, version: int) -> tuple[BarcodeIndex, bool]:
+    """
+    Applies changes published after version of index. Returns index with applied changes and whether it has
+    to be rebuilt, as changes are requested to rebuild it or are not available
+    """
+    if not 0 < version - index.version <= MAX_APPLIED_CHANGES:
+        return index, True
+
+    versions: range = range(index.version + 1, version + 1)
+    changes: dict = cache.get_many([BARCODE_INDEX_CHANGE_KEY.format(version=number) for number in versions])
+
+    applied_version: int = index.version
+    rebuild: bool = False
+    cleared: bool = False
+    local_states: dict = {}
+    remote_states: dict = {}
+    for number in versions:
+        change: dict | None = changes.get(BARCODE_INDEX_CHANGE_KEY.format(version=number))
+        if change is None:
+            # change could be published right after version was incremented, it is awaited for a while
+            rebuild = time.monotonic() - index.built_at >= settings.BARCODE_INDEX_REBUILD_SECONDS
+            break
+
+        if change.get('rebuild'):
+            rebuild = True
+        if change.get('cleared'):
+            cleared = True
+            local_states.clear()
+            remote_states.clear()
+        local_states.update(change.get('local', {}))
+        remote_states.update(change.get('remote', {}))
+        applied_version = number
+
+    if applied_version == index.version:
+        return index, rebuild
+    return index.apply(applied_version, cleared, local_states, remote_states), rebuild
+
+
+def get_barcode_index() -> BarcodeIndex:
+    """
+    Returns index of this process brought up to date with published changes. Index is rebuilt in background,
+    meanwhile it is used as it is; until the first index is built, empty one is returned, so all values
+    are checked with database. With BARCODE_INDEX_SYNC_REBUILD index is rebuilt right away
+    """
+    global barcode_index
+
+    index: BarcodeIndex | None = barcode_index
+    rebuild: bool = index is None
+
+    if index is not None:
+        version: int = get_barcode_index_version()
+        # other thread which brings index up to date is not awaited
+        if index.version != version and barcode_index_lock.acquire(blocking=False):
+            try:
+                index, rebuild = apply_barcode_changes(barcode_index, version)
+                barcode_index = index
+            finally:
+                barcode_index_lock.release()
+
+    if rebuild and settings.BARCODE_INDEX_SYNC_REBUILD:
+        return build_barcode_index()
+    if rebuild:
+        start_barcode_index_rebuild()
+
+    return index if index is not None else BarcodeIndex.from_values(0, (), ())
+
+
+def split_known_values(values: list[str]) -> tuple[list[str], list[str]]:
+    """
+    Splits values into ones present both in local and remote catalog and unknown ones
+    """
+    known, unknown = get_barcode_index().split(values)
+    if not unknown:
+        return known, unknown
+
+    # index could be built before the latest writes, so values missing in it are checked with database
+    found: set = set(filter_by_values(Product.objects.all(), 'value', unknown).values_list('value', flat=True))
+    if found:
+        found &= set(
+            filter_by_values(ProductRemote.objects.all(), 'value', list(found)).values_list('value', flat=True)
+        )
+    if not found:
+        return known, unknown
+
+    known_values: set = {*known, *found}
+    return [value for value in values if value in known_values], [value for value in unknown if value not in found]
@@ -0,0 +1,188 @@
+from typing import Type
+
+from django.db import IntegrityError, transaction
+from django.db.models.deletion import Collector
+from django.utils.translation import gettext_lazy as _
+from rest_framework.serializers import Serializer
+
+from products.barcodes import record_barcode_changes
+from products.caching import invalidate_products
+from products.functions import filter_by_values
+from products.models import OutboxEvent, Product
+from products.outbox import record_events
+from products.serializers import ProductBulkItemSerializer
+
+
+class BaseBulkProcessor:
+    # serializer for validating each item of payload
+    serializer_class: Type[Serializer] = ProductBulkItemSerializer
+
+    # amount of rows written per single query
+    batch_size: int = 1000
+
+    def __init__(self, items: list, user=None) -> None:
+        self.items: list = items
+        self.user = user
+        self._response: list[dict] = []
+
+    @staticmethod
+    def get_item_value(item) -> str | None:
+        if isinstance(item, dict):
+            return item.get('value')
+
+        return item
+
+    def add_result(self, value, result_status: str, errors: dict = None) -> None:
+        result = {'value': value, 'status': result_status}
+        if errors:
+            result['errors'] = errors
+        self._response.append(result)
+
+    def process(self) -> None:
+        raise NotImplementedError(f"You did not define 'process' in {self.__class__.__name__}.")
+
+    @property
+    def response(self) -> list[dict]:
+        return self._response
+
+
+class ProductBulkCreator(BaseBulkProcessor):
+
+    def process(self) -> None:
+        # getting all already existing values with one query instead of validator per item
+        values: list = [str(self.get_item_value(item)) for item in self.items if self.get_item_value(item)]
+        existing_values: set = set(
+            filter_by_values(Product.objects.all(), 'value', values).values_list('value', flat=True)
+        )
+
+        products_to_create: list[Product] = []
+        seen_values: set = set()
+
+        for item in self.items:
+            serializer = self.serializer_class(data=item)
+            if not serializer.is_valid():
+                self.add_result(self.get_item_value(item), 'invalid', serializer.errors)
+                continue
+
+            value: str = serializer.validated_data['value']
+            if value in existing_values or value in seen_values:
+                self.add_result(value, 'invalid', {'value': [_('Товар з таким штрих-кодом вже існує.')]})
+                continue
+
+            seen_values.add(value)
+            products_to_create.append(Product(**serializer.validated_data, creator=self.user))
+
+            # status is known only after product is written, as concurrent request could create the same value
+            self.add_result(value, 'created')
+
+        created_values: set = {product.value for product in self.create_products(products_to_create)}
+        for result in self._response:
+            if result['status'] == 'created' and result['value'] not in created_values:
+                result.update(status='invalid', errors={'value': [_('Товар з таким штрих-кодом вже існує.')]})
+
+    def create_products(self, products: list[Product]) -> list[Product]:
+        """
+        Writes products with single query. If some values were created by concurrent request meanwhile,
+        products are written one by one, so only conflicting ones fail
+        """
+        if not products:
+            return []
+
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(products, batch_size=self.batch_size)
+                record_events(products, OutboxEvent.ACTION_CREATED)
+        except IntegrityError:
+            created: list[Product] = []
+            for product in products:
+                # primary keys of batches written before the conflict were rolled back as well
+                product.pk, product._state.adding = None, True
+                try:
+                    with transaction.atomic():
+                        Product.objects.bulk_create([product])
+                        record_events([product], OutboxEvent.ACTION_CREATED)
+                except IntegrityError:
+                    continue
+                created.append(product)
+            products = created
+
+        record_barcode_changes(added=[product.value for product in products])
+        return products
+
+
+class ProductBulkUpdater(BaseBulkProcessor):
+
+    def process(self) -> None:
+        values: list = [str(self.get_item_value(item)) for item in self.items if self.get_item_value(item)]
+
+        with transaction.atomic():
+            products: dict[str, Product] = {
+                product.value: product
+                for product in filter_by_values(Product.objects.select_for_update(), 'value', values)
+            }
+
+            products_to_update: list[Product] = []
+            fields_to_update: set = set()
+            seen_values: set = set()
+
+            for item in self.items:
+                serializer = self.serializer_class(data=item, partial=True)
+                if not serializer.is_valid():
+                    self.add_result(self.get_item_value(item), 'invalid', serializer.errors)
+                    continue
+
+                value: str = serializer.validated_data.pop('value', None)
+                if not value:
+                    self.add_result(value, 'invalid', {'value': [_('Вкажіть штрих-код.')]})
+                    continue
+
+                if value in seen_values:
+                    self.add_result(value, 'invalid', {'value': [_('Штрих-код повторюється у запиті.')]})
+                    continue
+                seen_values.add(value)
+
+                product: Product = products.get(value)
+                if not product:
+                    self.add_result(value, 'not_found')
+                    continue
+
+                for field, field_value in serializer.validated_data.items():
+                    setattr(product, field, field_value)
+
+                fields_to_update.update(serializer.validated_data.keys())
+                products_to_update.append(product)
+                self.add_result(value, 'updated')
+
+            if products_to_update and fields_to_update:
+                Product.objects.bulk_update(products_to_update, fields=sorted(fields_to_update),
+                                            batch_size=self.batch_size)
+                record_events(products_to_update, OutboxEvent.ACTION_UPDATED, fields_to_update)
+                invalidate_products(product.value for product in products_to_update)
+
+
+class ProductBulkDestroyer(BaseBulkProcessor):
+
+    def process(self) -> None:
+        values: list = [str(self.get_item_value(item)) for item in self.items if self.get_item_value(item)]
+
+        with transaction.atomic():
+            products: list[Product] = list(filter_by_values(Product.objects.all(), 'value', values))
+            existing_values: set = {product.value for product in products}
+
+            # already fetched products are deleted by primary key without selecting them once again,
+            # related images are removed in bulk by cascade
+            record_events(products, OutboxEvent.ACTION_DELETED)
+            collector = Collector(using=Product.objects.db, origin=products)
+            collector.collect(products)
+            collector.delete()
+
+            invalidate_products(existing_values)
+            record_barcode_changes(removed=existing_values)
+
+        for item in self.items:
+            value = self.get_item_value(item)
+            if not value:
+                self.add_result(value, 'invalid', {'value': [_('Вкажіть штрих-код.')]})
+                continue
+
+            self.add_result(value, 'deleted' if str(value) in existing_values else 'not_found')
@@ -0,0 +1,63 @@
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from product_project.local_cache import LocalCache
+from products.functions import bump_catalog_version, get_catalog_version
+
+PRODUCT_CACHE_KEY = 'products:product:{value}'
+
+# process-local tier in front of shared cache, signals clear it only in the process which handled them
+local_products = LocalCache('PRODUCT_LOCAL_CACHE_SECONDS', 'PRODUCT_LOCAL_CACHE_SIZE')
+
+
+def form_product_cache_key(value: str) -> str:
+    return PRODUCT_CACHE_KEY.format(value=value)
+
+
+def get_cached_product(value: str) -> dict | None:
+    """
+    Returns entry with serialized product and catalog version it was cached with
+    from process memory or from shared cache
+    """
+    entry: dict | None = local_products.get(value)
+    if entry is not None:
+        return entry
+
+    entry = cache.get(form_product_cache_key(value))
+    if entry is not None:
+        local_products.set(value, entry)
+    return entry
+
+
+def set_cached_product(value: str, data: dict, version: int) -> dict:
+    """
+    Caches serialized product with catalog version which was read before the product. If catalog has changed
+    since then, product could be read before its invalidation, so entry is returned without caching
+    """
+    entry: dict = {'version': version, 'data': data}
+    if get_catalog_version() == version:
+        cache.set(form_product_cache_key(value), entry, settings.PRODUCT_CACHE_SECONDS)
+        local_products.set(value, entry)
+    return entry
+
+
+def invalidate_products(values: Iterable[str]) -> None:
+    """
+    Removes products from both tiers after the current transaction is committed,
+    so product could not be cached again with data which is not committed yet
+    """
+    values: set = {str(value) for value in values if value is not None}
+    if not values:
+        return
+
+    def invalidate() -> None:
+        # version is changed first, so product read before the change is not cached after its removal
+        bump_catalog_version()
+        for value in values:
+            local_products.delete(value)
+        cache.delete_many([form_product_cache_key(value) for value in values])
+
+    transaction.on_commit(invalidate)
@@ -1,4 +1,5 @@
 from enum import Enum
+from functools import lru_cache
 from typing import Type
 
 from django.db.models import Model
@@ -18,25 +19,23 @@ class ComparisonModelEnum(Enum):
     image = (Image, ImageRemote, ['product__value', 'alt'])
 
     @classmethod
-    def get_comparison_model(cls, model: Type[Model]) -> Type[Model]:
+    @lru_cache(maxsize=None)
+    def get_member(cls, model: Type[Model]) -> 'ComparisonModelEnum':
+        # result is cached, so enum is scanned only once for each model
         for tpl in cls:
             if tpl.value[0] == model:
-                return tpl.value[1]
+                return tpl
 
         raise ValueError(_('Вкажіть правильну модель.'))
 
     @classmethod
-    def get_core_fields(cls, model: Type[Model]) -> list:
-        for tpl in cls:
-            if tpl.value[0] == model:
-                return tpl.value[2]
+    def get_comparison_model(cls, model: Type[Model]) -> Type[Model]:
+        return cls.get_member(model).value[1]
 
-        raise ValueError(_('Вкажіть правильну модель.'))
+    @classmethod
+    def get_core_fields(cls, model: Type[Model]) -> list:
+        return cls.get_member(model).value[2]
 
     @classmethod
     def get_value_field(cls, model: Type[Model]) -> str:
-        for tpl in cls:
-            if tpl.value[0] == model:
-                return tpl.value[2][0]
-
-        raise ValueError(_('Вкажіть правильну модель.'))
+        return cls.get_member(model).value[2][0]
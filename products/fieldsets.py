@@ -0,0 +1,68 @@
+from typing import Type
+
+from django.db.models import QuerySet
+from django.http import QueryDict
+from django.utils.translation import gettext_lazy as _
+from rest_framework.serializers import Serializer
+
+from products.serializers import ProductListSerializer
+
+
+class ProductFieldset:
+    """
+    Parses 'fields' param of product list and retrieve, so only requested columns are selected,
+    images are prefetched only if they are requested and serializer contains requested fields only
+    """
+    serializer_class: Type[Serializer] = ProductListSerializer
+
+    # serializer fields which are backed by relation instead of column
+    relation_fields: dict[str, str] = {'images': 'image_set'}
+
+    def __init__(self, query_params: QueryDict) -> None:
+        self.query_params: QueryDict = query_params
+        self.errors: dict = {}
+        self.fields: list | None = None
+
+        self.define_fields()
+
+    @classmethod
+    def get_available_fields(cls) -> set:
+        if not hasattr(cls, '_available_fields'):
+            cls._available_fields = set(cls.serializer_class().fields.keys())
+        return cls._available_fields
+
+    def define_fields(self) -> None:
+        param: str = self.query_params.get('fields', '').strip()
+        if not param:
+            return
+
+        fields: list = list(dict.fromkeys(field.strip() for field in param.split(',') if field.strip()))
+        unknown: list = [field for field in fields if field not in self.get_available_fields()]
+        if unknown:
+            self.errors['fields'] = _('Невідомі поля: %s.') % ', '.join(unknown)
+            return
+
+        self.fields = fields
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    def apply_queryset(self, queryset: QuerySet) -> QuerySet:
+        if self.fields is None:
+            return queryset.prefetch_related(*self.relation_fields.values())
+
+        columns: list = [field for field in self.fields if field not in self.relation_fields]
+        queryset = queryset.only(*columns) if columns else queryset.only('pk')
+
+        for field, relation in self.relation_fields.items():
+            if field in self.fields:
+                queryset = queryset.prefetch_related(relation)
+
+        return queryset
+
+    def shrink(self, data: dict) -> dict:
+        # already serialized full representation is cut to requested fields
+        if self.fields is None:
+            return data
+        return {field: data[field] for field in self.fields}
@@ -0,0 +1,70 @@
+import math
+
+from django.db.models import Q, QuerySet
+from django.http import QueryDict
+from django.utils.translation import gettext_lazy as _
+
+
+class ProductFilter:
+    # fields which could be filtered by range with '<field>_min' and '<field>_max' params
+    range_fields: tuple = ('width', 'height', 'depth', 'volume')
+
+    # fields which could be used for sorting, each of them is backed by index
+    ordering_fields: tuple = ('value', 'name', 'width', 'height', 'depth', 'volume')
+
+    def __init__(self, query_params: QueryDict) -> None:
+        self.query_params: QueryDict = query_params
+        self.errors: dict = {}
+        self.conditions = Q()
+        self.ordering: list = []
+
+        self.define_conditions()
+        self.define_ordering()
+
+    def define_conditions(self) -> None:
+        search: str = self.query_params.get('search', '').strip()
+        if search:
+            # served by trigram index on upper-cased name
+            self.conditions &= Q(name__icontains=search)
+
+        for field in self.range_fields:
+            for suffix, lookup in (('min', 'gte'), ('max', 'lte')):
+                param: str = f'{field}_{suffix}'
+                if param not in self.query_params:
+                    continue
+
+                try:
+                    number: float = float(self.query_params[param])
+                except ValueError:
+                    number = math.nan
+
+                # nan and infinity are parsed by float(), but could not bound range
+                if not math.isfinite(number):
+                    self.errors[param] = _('Вкажіть число.')
+                    continue
+
+                self.conditions &= Q(**{f'{field}__{lookup}': number})
+
+    def define_ordering(self) -> None:
+        ordering: str = self.query_params.get('ordering', '')
+        for field in filter(None, ordering.split(',')):
+            if field.lstrip('-') not in self.ordering_fields:
+                self.errors['ordering'] = _('Перевірте правильність поля для сортування.')
+                return
+            self.ordering.append(field)
+
+        # primary key keeps pagination stable between pages
+        self.ordering.append('pk')
+
+    @property
+    def is_valid(self) -> bool:
+        if not self.errors:
+            return True
+
+        return False
+
+    def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+        if self.errors:
+            raise AttributeError("You couldn't filter queryset as there are errors.")
+
+        return queryset.filter(self.conditions).order_by(*self.ordering)
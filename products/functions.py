@@ -1,14 +1,67 @@
 import base64
 import hashlib
 import json
+import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import Type
 
+import requests
+from django.core.cache import cache
 from django.core.files import File
-from django.db.models import Model
+from django.db import connections, transaction
+from django.db.models import Model, QuerySet
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import Image as PillowImage
+from PIL import UnidentifiedImageError
 
-from products.models import ImageModelMixin, ProductModelMixin
+from product_project.settings import AUTH_TOKEN
+from products.models import (ImageModelMixin, OutboxEvent, ProductModelMixin,
+                             form_value_hash)
+from products.outbox import record_event
+
+REMOTE_BARCODE_URL = 'https://ps-dev.datawiz.io/uk/api/v1/barcode/'
+
+# hashes of values are unsigned 32-bit numbers
+VALUE_HASH_BITS = 32
+
+
+def fetch_remote_products(barcodes: list[str], chunk_size: int = None, concurrency: int = 1) -> list[dict]:
+    """
+    Requests products by barcodes from remote API. Barcodes are split into chunks if chunk_size is given,
+    chunks are requested by several threads at once
+    """
+    if not barcodes:
+        return []
+
+    chunk_size = chunk_size or len(barcodes)
+    chunks: list = [barcodes[start:start + chunk_size] for start in range(0, len(barcodes), chunk_size)]
+
+    def fetch_chunk(chunk: list[str]) -> list[dict]:
+        response = requests.get(f'{REMOTE_BARCODE_URL}?value={",".join(chunk)}', headers={
+            'Authorization': AUTH_TOKEN
+        })
+        return response.json()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return [item for response_data in executor.map(fetch_chunk, chunks) for item in response_data]
+
+
+def get_value_shard(value: str, shard_count: int) -> int:
+    # shards are equal ranges of hashes, so products of shard are selected by index of stored hash
+    return form_value_hash(value) * shard_count >> VALUE_HASH_BITS
+
+
+def get_shard_hash_range(shard: int, shard_count: int) -> tuple[int, int]:
+    """
+    Returns the first hash of shard and the first hash after it
+    """
+    # division is rounded up, so each hash belongs to exactly one shard
+    first_hash, next_hash = (-(-(number << VALUE_HASH_BITS) // shard_count) for number in (shard, shard + 1))
+    return first_hash, next_hash
 
 
 def parse_image(image_url: str) -> BytesIO:
@@ -21,6 +74,28 @@ def get_image_base64md5(image: BytesIO) -> str:
     return hashlib.md5(base64.b64encode(image.getvalue())).hexdigest()
 
 
+def read_image_metadata(image: BytesIO) -> dict:
+    """
+    Reads size, dimensions and MIME type of photo which is already in memory
+    """
+    metadata: dict = {
+        'size': len(image.getvalue()),
+        'width': None,
+        'height': None,
+        'mime_type': 'application/octet-stream',
+        'verified_at': timezone.now(),
+    }
+
+    try:
+        with PillowImage.open(BytesIO(image.getvalue())) as pillow_image:
+            metadata['width'], metadata['height'] = pillow_image.size
+            metadata['mime_type'] = PillowImage.MIME.get(pillow_image.format, metadata['mime_type'])
+    except UnidentifiedImageError:
+        pass
+
+    return metadata
+
+
 def extract_photos_from_products(response_data: list[dict]) -> tuple[list[dict], list]:
     """
     Extracting images from fetched products data and clearing response_data
@@ -49,17 +124,32 @@ def update_product_model(model: Type[ProductModelMixin], response_data: list, us
                 product = model.objects.get(value=product_value, creator__isnull=False)
             else:
                 product = model.objects.get(value=product_value)
+            fingerprints: dict = product.fingerprints
+            measure_date = product.measure_date
+
             product.name = item['name']
             product.measure_date = item['measure_date']
             product.width = item['width']
             product.height = item['height']
             product.depth = item['depth']
-            product.save()
+
+            # skipping write if nothing has changed
+            product.refresh_fingerprints()
+            if isinstance(product.measure_date, str):
+                product.measure_date = parse_datetime(product.measure_date)
+            if product.fingerprints == fingerprints and product.measure_date == measure_date:
+                continue
+
+            with transaction.atomic():
+                product.save()
+                record_event(product, OutboxEvent.ACTION_UPDATED)
         except model.DoesNotExist:
             if not getattr(model, 'is_remote'):
-                model.objects.create(
-                    **item
-                )
+                with transaction.atomic():
+                    product = model.objects.create(
+                        **item
+                    )
+                    record_event(product, OutboxEvent.ACTION_CREATED)
 
 
 def update_image_model(model: Type[ImageModelMixin], images: list) -> None:
@@ -75,12 +165,14 @@ def update_image_model(model: Type[ImageModelMixin], images: list) -> None:
                 image_hash: str = get_image_base64md5(image_io)
                 image.hash = image_hash
                 image.alt = item['alt']
-                image.photo.save(f'image-{item["product"]}-{image_alt}.jpg', File(image_io))
-                image.save()
+                image.set_metadata(read_image_metadata(image_io))
+                with transaction.atomic():
+                    image.photo.save(f'image-{item["product"]}-{image_alt}.jpg', File(image_io))
+                    image.save()
+                    record_event(image, OutboxEvent.ACTION_UPDATED)
         except model.DoesNotExist:
             if not getattr(model, 'is_remote'):
-                response_photo = urllib.request.urlopen(item['photo'])
-                image_io = parse_image(response_photo.read())
+                image_io = parse_image(item['photo'])
 
                 image_hash = get_image_base64md5(image_io)
                 img_to_save = model(
@@ -88,7 +180,22 @@ def update_image_model(model: Type[ImageModelMixin], images: list) -> None:
                     alt=item['alt'],
                     hash=image_hash
                 )
-                img_to_save.photo.save(f'image-{item["product"]}.jpg', File(image_io))
+                img_to_save.set_metadata(read_image_metadata(image_io))
+                with transaction.atomic():
+                    img_to_save.photo.save(f'image-{item["product"]}.jpg', File(image_io))
+                    record_event(img_to_save, OutboxEvent.ACTION_CREATED)
+
+
+def filter_by_values(queryset: QuerySet, field_name: str, values: list) -> QuerySet:
+    """
+    Filters queryset by possibly huge list of values. On PostgreSQL values are passed as a single array
+    and joined with unnest() instead of building IN list with parameter for each value
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        values_array = RawSQL('SELECT unnest(%s::text[])', ([str(value) for value in values],))
+        return queryset.filter(**{f'{field_name}__in': values_array})
+
+    return queryset.filter(**{f'{field_name}__in': values})
 
 
 def form_cache_key(model: Type[Model], values: list[str], fields: list) -> str:
@@ -99,3 +206,29 @@ def form_cache_key(model: Type[Model], values: list[str], fields: list) -> str:
     }
     cache_key = hashlib.sha256(json.dumps(cache_data, sort_keys=True).encode()).hexdigest()
     return cache_key
+
+
+CATALOG_VERSION_CACHE_KEY = 'products:catalog-version'
+
+
+def get_catalog_version() -> int:
+    version = cache.get(CATALOG_VERSION_CACHE_KEY)
+    if version is None:
+        # starting from the current time, so versions issued before the key was evicted could not repeat
+        cache.add(CATALOG_VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_CACHE_KEY)
+    return version
+
+
+def bump_catalog_version() -> None:
+    """
+    Marks catalog as changed, so all previously issued ETags become stale
+    """
+    try:
+        cache.incr(CATALOG_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+
+
+def form_etag(*parts) -> str:
+    return '"%s"' % hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
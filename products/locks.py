@@ -0,0 +1,166 @@
+import threading
+from contextlib import contextmanager
+from typing import Type
+
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.db.models import Model
+
+from products.functions import form_cache_key
+
+# lock of whole database renewal, no synchronization jobs could run with it
+RENEW_LOCK_KEY = 'products:renew-lock'
+
+# amount of image batches queued by renewal which are not finished yet
+RENEW_BATCHES_KEY = 'products:renew-batches:{task_id}'
+
+# amount of synchronization jobs which are running right now
+ACTIVE_SYNC_JOBS_KEY = 'products:active-sync-jobs'
+
+# locks expire by themselves, so crashed worker could not block jobs forever
+LOCK_TIMEOUT = 60 * 60 * 3
+
+# seconds after which job postponed because of lock is retried
+LOCK_RETRY_COUNTDOWN = 60
+
+# lock of synchronization job lives while job is queued or retried, afterwards it is refreshed
+# by running job, so lock of crashed worker expires soon instead of blocking the same requests for hours
+TASK_LOCK_QUEUED_TIMEOUT = 60 * 30
+TASK_LOCK_TIMEOUT = 60 * 5
+TASK_LOCK_REFRESH_INTERVAL = 60
+
+
+def form_task_lock_key(model: Type[Model], values: list | None, fields: list) -> str:
+    return 'products:task-lock:' + form_cache_key(model, sorted(values or []), sorted(fields))
+
+
+def acquire_task_lock(key: str, task_id: str) -> str:
+    """
+    Returns id of task which holds the lock. It equals to task_id if lock was acquired,
+    otherwise there is the same job already queued or running
+    """
+    if cache.add(key, task_id, TASK_LOCK_QUEUED_TIMEOUT):
+        return task_id
+
+    holder: str = cache.get(key)
+    if holder:
+        return holder
+
+    # lock has expired between the calls
+    return acquire_task_lock(key, task_id)
+
+
+def release_task_lock(key: str, task_id: str) -> None:
+    if cache.get(key) == task_id:
+        cache.delete(key)
+
+
+def refresh_task_lock(key: str, task_id: str, timeout: int = TASK_LOCK_TIMEOUT) -> None:
+    if cache.get(key) == task_id:
+        cache.touch(key, timeout)
+
+
+@contextmanager
+def refreshing_task_lock(key: str, task_id: str):
+    """
+    Refreshes task lock in background thread while job runs
+    """
+    stopped = threading.Event()
+
+    def refresh() -> None:
+        while not stopped.wait(TASK_LOCK_REFRESH_INTERVAL):
+            refresh_task_lock(key, task_id)
+
+    refresh_task_lock(key, task_id)
+    refresher = threading.Thread(target=refresh, daemon=True)
+    refresher.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        refresher.join()
+
+
+def register_sync_job() -> bool:
+    """
+    Marks synchronization job as running. Returns False if renewal of database is running,
+    in this case job has to be postponed
+    """
+    cache.add(ACTIVE_SYNC_JOBS_KEY, 0, LOCK_TIMEOUT)
+    cache.incr(ACTIVE_SYNC_JOBS_KEY)
+
+    # incr keeps expiration of the first registration, so counter could expire while later jobs still run
+    cache.touch(ACTIVE_SYNC_JOBS_KEY, LOCK_TIMEOUT)
+
+    if cache.get(RENEW_LOCK_KEY):
+        unregister_sync_job()
+        return False
+
+    return True
+
+
+def unregister_sync_job() -> None:
+    try:
+        if cache.decr(ACTIVE_SYNC_JOBS_KEY) < 0:
+            cache.set(ACTIVE_SYNC_JOBS_KEY, 0, LOCK_TIMEOUT)
+    except ValueError:
+        pass
+
+
+@contextmanager
+def running_sync_job(task, lock_key: str):
+    """
+    Runs synchronization job under its task lock, which is refreshed while job runs and released when job
+    is finished or failed. If renewal of database is running, job is retried later and keeps the lock,
+    so the same requests are still attached to it
+    """
+    task_id: str = task.request.id
+    try:
+        if not register_sync_job():
+            raise task.retry(countdown=LOCK_RETRY_COUNTDOWN)
+    except Retry:
+        refresh_task_lock(lock_key, task_id, TASK_LOCK_QUEUED_TIMEOUT)
+        raise
+    except Exception:
+        release_task_lock(lock_key, task_id)
+        raise
+
+    try:
+        with refreshing_task_lock(lock_key, task_id):
+            yield
+    finally:
+        unregister_sync_job()
+        release_task_lock(lock_key, task_id)
+
+
+def acquire_renew_lock(task_id: str) -> bool:
+    return cache.add(RENEW_LOCK_KEY, task_id, LOCK_TIMEOUT)
+
+
+def release_renew_lock(task_id: str) -> None:
+    release_task_lock(RENEW_LOCK_KEY, task_id)
+
+
+def hand_over_renew_lock(task_id: str, batches: int) -> None:
+    """
+    Keeps renew lock held until all image batches queued by renewal are finished,
+    the last of them releases it
+    """
+    cache.set(RENEW_BATCHES_KEY.format(task_id=task_id), batches, LOCK_TIMEOUT)
+
+
+def finish_renew_batch(task_id: str) -> None:
+    key: str = RENEW_BATCHES_KEY.format(task_id=task_id)
+    try:
+        left: int = cache.decr(key)
+    except ValueError:
+        # counter has expired together with the lock
+        return
+
+    if left <= 0:
+        cache.delete(key)
+        release_renew_lock(task_id)
+
+
+def has_active_sync_jobs() -> bool:
+    return cache.get(ACTIVE_SYNC_JOBS_KEY, 0) > 0
@@ -0,0 +1,151 @@
+import mimetypes
+import os
+import re
+from typing import Iterator
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# files are never changed in place, new photo is always saved under new name
+MEDIA_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iterate_media_files(directory: str) -> Iterator[tuple[str, float]]:
+    """
+    Yields names of files in media directory with their modification time, local directory is read lazily
+    """
+    try:
+        root: str = default_storage.path(directory)
+    except NotImplementedError:
+        # storages without local path could only list the whole directory at once
+        for file_name in default_storage.listdir(directory)[1]:
+            name = f'{directory}/{file_name}'
+            yield name, default_storage.get_modified_time(name).timestamp()
+        return
+
+    if not os.path.isdir(root):
+        return
+
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_file():
+                yield f'{directory}/{entry.name}', entry.stat().st_mtime
+
+
+def get_media_etag(stat: os.stat_result) -> str:
+    # files are not changed in place, so their stat identifies content without reading file or database
+    return f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Returns first and last byte of single range. None means that header has to be ignored and the whole
+    file is served, as multiple ranges are not supported and invalid header is ignored by RFC 9110.
+    ValueError is raised only for range which could not be satisfied
+    """
+    match = RANGE_RE.match(range_header.strip())
+    if not match or not any(match.groups()):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # suffix range with amount of last bytes
+        if not int(end) or not size:
+            raise ValueError()
+        return max(size - int(end), 0), size - 1
+
+    if end and int(end) < int(start):
+        return None
+
+    start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise ValueError()
+
+    return start, end
+
+
+def read_file_range(path: str, start: int, length: int):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def set_cache_headers(response: HttpResponse, etag: str, stat: os.stat_result) -> HttpResponse:
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = MEDIA_CACHE_CONTROL
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve_media(request, path: str) -> HttpResponse:
+    """
+    Serves uploaded files. If front server is configured, file is handed to it with
+    X-Sendfile or X-Accel-Redirect, otherwise it is streamed with Range support
+    """
+    try:
+        full_path: str = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404()
+
+    if not os.path.isfile(full_path):
+        raise Http404()
+
+    stat: os.stat_result = os.stat(full_path)
+    etag: str = get_media_etag(stat)
+    content_type: str = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_SENDFILE_HEADER == 'X-Accel-Redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+        else:
+            response[settings.MEDIA_SENDFILE_HEADER] = os.path.abspath(full_path)
+        return set_cache_headers(response, etag, stat)
+
+    if_none_match: str = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags: list = [item.removeprefix('W/') for item in parse_etags(if_none_match)]
+        if '*' in etags or etag in etags:
+            return set_cache_headers(HttpResponse(status=304), etag, stat)
+
+    range_header: str = request.META.get('HTTP_RANGE')
+    if_range: str = request.META.get('HTTP_IF_RANGE')
+
+    # range is ignored if file has changed since client got its part
+    byte_range: tuple[int, int] | None = None
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        length: int = end - start + 1
+        response = StreamingHttpResponse(read_file_range(full_path, start, length), status=206,
+                                         content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        return set_cache_headers(response, etag, stat)
+
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    return set_cache_headers(response, etag, stat)
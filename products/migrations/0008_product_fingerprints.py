@@ -0,0 +1,77 @@
+# Generated by Django 4.2.2 on 2026-10-19 16:58
+
+import hashlib
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def form_fingerprint(*values):
+    parts = [repr(float(value)) if isinstance(value, (int, float)) else str(value) for value in values]
+    return hashlib.md5('\x1f'.join(parts).encode()).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    for product_model_name, image_model_name in (('Product', 'Image'), ('ProductRemote', 'ImageRemote')):
+        product_model = apps.get_model('products', product_model_name)
+        image_model = apps.get_model('products', image_model_name)
+
+        images = defaultdict(list)
+        for product_id, alt, image_hash in image_model.objects.order_by('product_id', 'alt')\
+                .values_list('product_id', 'alt', 'hash').iterator():
+            images[product_id].extend((alt, image_hash))
+
+        fields = ['name_fingerprint', 'size_fingerprint', 'images_fingerprint']
+        products = []
+        for product in product_model.objects.iterator():
+            product.name_fingerprint = form_fingerprint(product.name)
+            product.size_fingerprint = form_fingerprint(product.width, product.height, product.depth)
+            product.images_fingerprint = form_fingerprint(*images[product.pk])
+            products.append(product)
+
+            if len(products) >= 1000:
+                product_model.objects.bulk_update(products, fields)
+                products = []
+
+        product_model.objects.bulk_update(products, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_remove_productremote_creator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='images_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='name_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='size_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='productremote',
+            name='images_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='productremote',
+            name='name_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='productremote',
+            name='size_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
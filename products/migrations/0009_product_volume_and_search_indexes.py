@@ -0,0 +1,60 @@
+# Generated by Django 4.2.2 on 2026-10-19 17:00
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+import products.models
+
+
+def fill_volume(apps, schema_editor):
+    for model_name in ('Product', 'ProductRemote'):
+        model = apps.get_model('products', model_name)
+        model.objects.update(volume=models.F('width') * models.F('height') * models.F('depth'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_fingerprints'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='volume',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productremote',
+            name='volume',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_volume, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=products.models.TrigramIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='product_name_upper_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['width'], name='product_width_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['height'], name='product_height_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['depth'], name='product_depth_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['volume'], name='product_volume_idx'),
+        ),
+    ]
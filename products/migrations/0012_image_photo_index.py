@@ -0,0 +1,23 @@
+# Generated by Django 4.2.2 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='photo',
+            field=models.ImageField(db_index=True, upload_to='photo/'),
+        ),
+        migrations.AlterField(
+            model_name='imageremote',
+            name='photo',
+            field=models.ImageField(db_index=True, upload_to='photo/'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.2 on 2026-10-19 17:55
+
+import zlib
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_value_hash(apps, schema_editor):
+    for model_name in ('Product', 'ProductRemote'):
+        model = apps.get_model('products', model_name)
+
+        batch: list = []
+        for pk, value in model.objects.values_list('pk', 'value').iterator(chunk_size=BATCH_SIZE):
+            batch.append(model(pk=pk, value_hash=zlib.crc32(str(value).encode())))
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ['value_hash'])
+                batch = []
+
+        if batch:
+            model.objects.bulk_update(batch, ['value_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_image_photo_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='value_hash',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productremote',
+            name='value_hash',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(fill_value_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from product_project.routers import use_replica
+
+
+class ReplicaReadMixin:
+    """
+    Sends queries of read-only actions to replicas. After user writes something,
+    their requests are read from primary for a while, so they see their own changes.
+    Conditional requests are always read from primary, so body of lagging replica never gets 304
+    """
+    replica_actions: tuple = ()
+
+    @staticmethod
+    def get_pin_cache_key(user) -> str:
+        return f'db-primary-pin:{user.pk}'
+
+    def is_pinned_to_primary(self, request) -> bool:
+        if not request.user.is_authenticated:
+            return False
+
+        return bool(cache.get(self.get_pin_cache_key(request.user)))
+
+    def should_use_replica(self, request) -> bool:
+        if not settings.DATABASE_REPLICAS or self.action not in self.replica_actions:
+            return False
+
+        if request.META.get('HTTP_IF_NONE_MATCH'):
+            return False
+
+        return not self.is_pinned_to_primary(request)
+
+    @property
+    def uses_replica(self) -> bool:
+        return bool(getattr(self, '_replica_token', None))
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        if self.should_use_replica(request):
+            self._replica_token = use_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token:
+            use_replica.reset(token)
+            self._replica_token = None
+
+        # read-only actions sent with POST, like comparison with barcodes in body, do not pin user
+        is_write: bool = request.method not in SAFE_METHODS and self.action not in self.replica_actions
+        if is_write and response.status_code < 400 and request.user.is_authenticated:
+            cache.set(self.get_pin_cache_key(request.user), True, settings.REPLICA_STICKINESS_SECONDS)
+
+        return super().finalize_response(request, response, *args, **kwargs)
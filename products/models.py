@@ -1,9 +1,96 @@
+import hashlib
+import zlib
+from collections import defaultdict
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Upper
 
 from users.models import User
 
 
+def form_fingerprint(*values) -> str:
+    # numbers are normalized, so 1 and 1.0 give the same fingerprint
+    parts = [repr(float(value)) if isinstance(value, (int, float)) else str(value) for value in values]
+    return hashlib.md5('\x1f'.join(parts).encode()).hexdigest()
+
+
+def form_value_hash(value) -> int:
+    # crc32 is stable between processes, unlike built-in hash() of strings
+    return zlib.crc32(str(value).encode())
+
+
+class TrigramIndex(GinIndex):
+    """
+    GIN index with trigram operator classes on PostgreSQL. Other databases have neither of them,
+    so the same expressions are indexed with regular index there, as tables are rebuilt with their indexes
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+        expressions: list = [
+            expression.get_source_expressions()[0] if isinstance(expression, OpClass) else expression
+            for expression in self.expressions
+        ]
+        return models.Index(*expressions, name=self.name).create_sql(model, schema_editor, using=using, **kwargs)
+
+
+class ProductManager(models.Manager):
+    # amount of products processed per query while refreshing images fingerprints
+    fingerprint_batch_size: int = 1000
+
+    def bulk_create(self, objs, *args, **kwargs):
+        for obj in objs:
+            obj.refresh_computed_fields()
+
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        for obj in objs:
+            obj.refresh_computed_fields()
+
+        fields = [*fields, *self.model.get_computed_field_names()]
+        return super().bulk_update(objs, list(dict.fromkeys(fields)), *args, **kwargs)
+
+    def refresh_images_fingerprints(self, product_ids) -> None:
+        """
+        Recomputes fingerprints of images of indicated products in batches
+        """
+        product_ids: list = list(product_ids)
+        image_model = self.model._meta.get_field(self.model.image_query_name).related_model
+
+        for start in range(0, len(product_ids), self.fingerprint_batch_size):
+            batch: list = product_ids[start:start + self.fingerprint_batch_size]
+
+            images: dict[int, list] = defaultdict(list)
+            for product_id, alt, image_hash in image_model.objects.filter(product_id__in=batch)\
+                    .order_by('product_id', 'alt').values_list('product_id', 'alt', 'hash'):
+                images[product_id].extend((alt, image_hash))
+
+            # plain queryset bulk_update, so other fingerprints of not fetched products stay untouched
+            self.get_queryset().bulk_update(
+                [self.model(pk=product_id, images_fingerprint=form_fingerprint(*images[product_id]))
+                 for product_id in batch],
+                ['images_fingerprint']
+            )
+
+
 class ProductModelMixin(models.Model):
+    # groups of fields with stored fingerprint for cheap detection of changes
+    fingerprint_groups: dict[str, tuple] = {
+        'name': ('name',),
+        'size': ('width', 'height', 'depth'),
+    }
+
+    # name of reverse relation to images of product
+    image_query_name: str = None
+
+    # fields passed to consumers of change events
+    event_fields: tuple = ('value', 'name', 'measure_date', 'width', 'height', 'depth')
+
     name = models.CharField(max_length=500)
     value = models.TextField(unique=True)
     measure_date = models.DateTimeField(blank=True, null=True)
@@ -11,6 +98,44 @@ class ProductModelMixin(models.Model):
     height = models.FloatField()
     depth = models.FloatField()
 
+    name_fingerprint = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
+    size_fingerprint = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
+    images_fingerprint = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
+
+    # stored for filtering and sorting by volume
+    volume = models.FloatField(default=0, editable=False)
+
+    # stored hash of value, its ranges split catalog into shards of rolling renew
+    value_hash = models.BigIntegerField(default=0, db_index=True, editable=False)
+
+    objects = ProductManager()
+
+    @classmethod
+    def get_computed_field_names(cls) -> list[str]:
+        return ['volume', 'value_hash', *[f'{group}_fingerprint' for group in cls.fingerprint_groups]]
+
+    def refresh_fingerprints(self) -> None:
+        for group, field_names in self.fingerprint_groups.items():
+            setattr(self, f'{group}_fingerprint', form_fingerprint(*[getattr(self, name) for name in field_names]))
+
+    def refresh_computed_fields(self) -> None:
+        self.refresh_fingerprints()
+        self.volume = self.width * self.height * self.depth
+        self.value_hash = form_value_hash(self.value)
+
+    @property
+    def fingerprints(self) -> dict[str, str]:
+        return {group: getattr(self, f'{group}_fingerprint') for group in self.fingerprint_groups}
+
+    def save(self, *args, **kwargs):
+        self.refresh_computed_fields()
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.get_computed_field_names()}
+
+        super().save(*args, **kwargs)
+
     @property
     def is_remote(self) -> bool:
         return False
@@ -20,10 +145,24 @@ class ProductModelMixin(models.Model):
 
 
 class Product(ProductModelMixin):
+    image_query_name = 'image'
+
     creator = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # trigram index serves case-insensitive substring search by name, icontains compares upper-cased name
+            TrigramIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='product_name_upper_trgm_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),
+            models.Index(fields=['width'], name='product_width_idx'),
+            models.Index(fields=['height'], name='product_height_idx'),
+            models.Index(fields=['depth'], name='product_depth_idx'),
+            models.Index(fields=['volume'], name='product_volume_idx'),
+        ]
+
 
 class ProductRemote(ProductModelMixin):
+    image_query_name = 'imageremote'
 
     @property
     def is_remote(self) -> bool:
@@ -36,7 +175,13 @@ class ImageManager(models.Manager):
         self.validate_images(objs)
 
         # Call the original bulk_create method
-        return super().bulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        created = super().bulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+
+        self.refresh_products_fingerprints({obj.product_id for obj in objs})
+        return created
+
+    def refresh_products_fingerprints(self, product_ids) -> None:
+        self.model._meta.get_field('product').related_model.objects.refresh_images_fingerprints(product_ids)
 
     def validate_images(self, objs):
         for obj in objs:
@@ -47,12 +192,29 @@ class ImageManager(models.Manager):
 
 class ImageModelMixin(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    photo = models.ImageField(upload_to='photo/')
+    # indexed for lookups of images by file name
+    photo = models.ImageField(upload_to='photo/', db_index=True)
     alt = models.CharField(max_length=255)
     hash = models.CharField(max_length=32)
 
+    # metadata captured when photo is saved, so file does not have to be opened to get it
+    size = models.PositiveBigIntegerField(blank=True, null=True)
+    width = models.PositiveIntegerField(blank=True, null=True)
+    height = models.PositiveIntegerField(blank=True, null=True)
+    mime_type = models.CharField(max_length=100, blank=True)
+    verified_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
     objects = ImageManager()
 
+    metadata_fields: tuple = ('size', 'width', 'height', 'mime_type', 'verified_at')
+
+    # fields passed to consumers of change events
+    event_fields: tuple = ('product', 'alt', 'hash', 'photo', 'size', 'width', 'height', 'mime_type')
+
+    def set_metadata(self, metadata: dict) -> None:
+        for field in self.metadata_fields:
+            setattr(self, field, metadata.get(field))
+
     def save(self, *args, **kwargs):
         # Check if there is another Image with the same product and alt
         existing_image = self.__class__.objects.filter(product=self.product, alt=self.alt).exclude(id=self.id).first()
@@ -61,6 +223,15 @@ class ImageModelMixin(models.Model):
 
         super().save(*args, **kwargs)
 
+        self.__class__.objects.refresh_products_fingerprints([self.product_id])
+
+    def delete(self, *args, **kwargs):
+        product_id = self.product_id
+        result = super().delete(*args, **kwargs)
+
+        self.__class__.objects.refresh_products_fingerprints([product_id])
+        return result
+
     @property
     def is_remote(self) -> bool:
         return False
@@ -79,3 +250,29 @@ class ImageRemote(ImageModelMixin):
     @property
     def is_remote(self) -> bool:
         return True
+
+
+class OutboxEvent(models.Model):
+    """
+    Change of product or image, which is written in the same transaction as the change itself
+    and is delivered to consumers later by publisher
+    """
+    ACTION_CREATED = 'created'
+    ACTION_UPDATED = 'updated'
+    ACTION_DELETED = 'deleted'
+
+    ACTION_CHOICES = (
+        (ACTION_CREATED, 'Created'),
+        (ACTION_UPDATED, 'Updated'),
+        (ACTION_DELETED, 'Deleted'),
+    )
+
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField(blank=True, null=True)
+    action = models.CharField(max_length=16, choices=ACTION_CHOICES)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    class Meta:
+        ordering = ('id',)
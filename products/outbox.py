@@ -0,0 +1,109 @@
+import json
+from typing import Iterable
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from products.models import OutboxEvent
+
+
+def form_event_payload(instance: models.Model, fields: Iterable[str] = None) -> dict:
+    payload: dict = {}
+    for name in fields or instance.event_fields:
+        value = getattr(instance, instance._meta.get_field(name).attname)
+        payload[name] = value.name if isinstance(value, FieldFile) else value
+    return payload
+
+
+def form_event(instance: models.Model, action: str, fields: Iterable[str] = None) -> OutboxEvent:
+    payload: dict = form_event_payload(instance)
+    if fields is not None:
+        # consumers are told which fields were changed by partial update
+        payload['changed_fields'] = sorted(fields)
+
+    return OutboxEvent(model=instance._meta.model_name, object_id=instance.pk, action=action, payload=payload)
+
+
+def record_event(instance: models.Model, action: str, fields: Iterable[str] = None) -> None:
+    """
+    Has to be called inside the transaction which performs the change, so event is stored only with it
+    """
+    form_event(instance, action, fields).save()
+
+
+def record_events(instances: Iterable[models.Model], action: str, fields: Iterable[str] = None) -> None:
+    OutboxEvent.objects.bulk_create(
+        [form_event(instance, action, fields) for instance in instances], batch_size=settings.OUTBOX_BATCH_SIZE
+    )
+
+
+def form_message(event: OutboxEvent) -> dict[str, str]:
+    # stream entries consist of flat string fields only
+    return {
+        'id': str(event.pk),
+        'model': event.model,
+        'object_id': '' if event.object_id is None else str(event.object_id),
+        'action': event.action,
+        'payload': json.dumps(event.payload, cls=DjangoJSONEncoder),
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+class BaseOutboxPublisher:
+
+    def publish(self, messages: list[dict]) -> None:
+        raise NotImplementedError
+
+
+class RedisStreamPublisher(BaseOutboxPublisher):
+    """
+    Appends events to Redis stream, which consumers tail with XREAD or consumer groups
+    """
+
+    def __init__(self) -> None:
+        self.client = redis.Redis.from_url(settings.OUTBOX_REDIS_URL)
+
+    def publish(self, messages: list[dict]) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        for message in messages:
+            pipeline.xadd(settings.OUTBOX_STREAM, message, maxlen=settings.OUTBOX_STREAM_MAX_LENGTH,
+                          approximate=True)
+        pipeline.execute()
+
+
+class LocalStreamPublisher(BaseOutboxPublisher):
+    """
+    Keeps published events in memory of the current process, it is used instead of Redis in tests
+    """
+    stream: list[dict] = []
+
+    def publish(self, messages: list[dict]) -> None:
+        self.stream.extend(messages)
+
+
+def get_outbox_publisher() -> BaseOutboxPublisher:
+    return import_string(settings.OUTBOX_PUBLISHER)()
+
+
+def publish_outbox_batch(publisher: BaseOutboxPublisher, batch_size: int) -> int:
+    """
+    Publishes the oldest unpublished events and marks them as published. Rows are locked until commit,
+    so concurrent publisher skips them instead of sending them twice
+    """
+    with transaction.atomic():
+        events: list[OutboxEvent] = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True).filter(published_at__isnull=True)
+            .order_by('pk')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        publisher.publish([form_message(event) for event in events])
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(published_at=timezone.now())
+
+    return len(events)
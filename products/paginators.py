@@ -1,6 +1,77 @@
+import base64
+import binascii
+import json
+
+from django.db.models import F, QuerySet
+from django.http import QueryDict
 from rest_framework.pagination import PageNumberPagination
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     page_size = 100
+
+
+class ComparisonCursorPagination:
+    """
+    Keyset pagination of each field group of comparison, so memory and latency are bounded by page size
+    """
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    max_page_size = 1000
+
+    def __init__(self, query_params: QueryDict) -> None:
+        self.page_size: int = int(query_params[self.page_size_query_param])
+        if self.page_size <= 0:
+            raise ValueError()
+        self.page_size = min(self.page_size, self.max_page_size)
+
+        self.positions: dict[str, int] | None = self.decode_cursor(query_params.get(self.cursor_query_param))
+
+    @staticmethod
+    def encode_cursor(positions: dict[str, int]) -> str | None:
+        if not positions:
+            return None
+
+        return base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str | None) -> dict[str, int] | None:
+        if not cursor:
+            return None
+
+        try:
+            positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+            raise ValueError()
+
+        if not isinstance(positions, dict) or not all(isinstance(pk, int) for pk in positions.values()):
+            raise ValueError()
+
+        return positions
+
+    def paginate(self, group_querysets: dict[str, QuerySet]) -> tuple[dict[str, list], str | None]:
+        """
+        Returns page of each field group and cursor of the next page
+        """
+        results: dict[str, list] = {}
+        next_positions: dict[str, int] = {}
+
+        for key, queryset in group_querysets.items():
+            # group is absent in cursor when all its rows were already returned
+            if self.positions is not None and key not in self.positions:
+                continue
+
+            if self.positions:
+                queryset = queryset.filter(pk__gt=self.positions[key])
+
+            rows: list = list(queryset.annotate(cursor_pk=F('pk')).order_by('pk')[:self.page_size + 1])
+            if len(rows) > self.page_size:
+                rows = rows[:self.page_size]
+                next_positions[key] = rows[-1]['cursor_pk']
+
+            for row in rows:
+                del row['cursor_pk']
+            results[key] = rows
+
+        return results, self.encode_cursor(next_positions)
@@ -0,0 +1,207 @@
+import datetime
+import io
+import json
+import os
+from typing import Iterator, Type
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+
+from products.models import Image, ImageRemote, Product, ProductRemote
+
+# products go first, so rows referenced by images already exist while they are imported
+CATALOG_MODELS: tuple = (Product, ProductRemote, Image, ImageRemote)
+
+MANIFEST_NAME = 'manifest.json'
+
+ARROW_TYPES: dict = {
+    'AutoField': pa.int64(),
+    'BigAutoField': pa.int64(),
+    'IntegerField': pa.int64(),
+    'BigIntegerField': pa.int64(),
+    'PositiveIntegerField': pa.int64(),
+    'PositiveBigIntegerField': pa.int64(),
+    'ForeignKey': pa.int64(),
+    'FloatField': pa.float64(),
+    'BooleanField': pa.bool_(),
+    'DateTimeField': pa.timestamp('us', tz='UTC'),
+}
+
+
+def get_columns(model: Type[models.Model]) -> list[models.Field]:
+    return list(model._meta.concrete_fields)
+
+
+def get_external_foreign_keys(model: Type[models.Model]) -> list[models.ForeignKey]:
+    # rows referenced by these columns, like creators of products, are not part of export
+    return [field for field in get_columns(model) if field.many_to_one and field.related_model not in CATALOG_MODELS]
+
+
+def get_arrow_schema(model: Type[models.Model]) -> pa.Schema:
+    # schema is defined by model, so all parts of table have the same types even if some column is empty
+    return pa.schema([
+        pa.field(field.attname, ARROW_TYPES.get(field.get_internal_type(), pa.string()), nullable=True)
+        for field in get_columns(model)
+    ])
+
+
+def iterate_chunks(model: Type[models.Model], chunk_size: int) -> Iterator[list[tuple]]:
+    """
+    Reads rows of model ordered by primary key with keyset pagination, so memory is bounded by chunk
+    """
+    attnames: list = [field.attname for field in get_columns(model)]
+    last_pk = None
+    while True:
+        queryset = model._base_manager.order_by('pk')
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+
+        rows: list = list(queryset.values_list(*attnames)[:chunk_size])
+        if not rows:
+            return
+
+        yield rows
+        last_pk = rows[-1][attnames.index(model._meta.pk.attname)]
+
+
+def export_model(model: Type[models.Model], directory: str, chunk_size: int) -> dict:
+    table_directory: str = os.path.join(directory, model._meta.db_table)
+    os.makedirs(table_directory, exist_ok=True)
+
+    schema: pa.Schema = get_arrow_schema(model)
+    parts: list = []
+    rows_count: int = 0
+    for index, rows in enumerate(iterate_chunks(model, chunk_size)):
+        columns: list = [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)]
+        part_name: str = f'part-{index:05d}.parquet'
+        pq.write_table(pa.Table.from_arrays(columns, schema=schema), os.path.join(table_directory, part_name),
+                       compression='zstd')
+
+        parts.append(part_name)
+        rows_count += len(rows)
+
+    return {'table': model._meta.db_table, 'columns': schema.names, 'rows': rows_count, 'parts': parts}
+
+
+def export_catalog(directory: str, chunk_size: int) -> dict:
+    """
+    Writes each catalog table into chunked Parquet files and manifest which describes them
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest: dict = {
+        'created_at': datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        'models': {model.__name__: export_model(model, directory, chunk_size) for model in CATALOG_MODELS},
+    }
+
+    with open(os.path.join(directory, MANIFEST_NAME), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def format_copy_value(value) -> str:
+    # text format of COPY: \N is NULL, backslash and delimiters are escaped
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(model: Type[models.Model], columns: list[str], rows: list[dict]) -> None:
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(format_copy_value(row[column]) for column in columns) + '\n')
+    buffer.seek(0)
+
+    quoted_columns: str = ', '.join(connection.ops.quote_name(column) for column in columns)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} ({quoted_columns}) FROM STDIN', buffer
+        )
+
+
+def insert_rows(model: Type[models.Model], rows: list[dict]) -> None:
+    # base manager skips validation and recalculation made by custom managers
+    model._base_manager.bulk_create([model(**row) for row in rows], batch_size=len(rows))
+
+
+def check_foreign_keys(directory: str, manifest: dict, overrides: dict) -> None:
+    """
+    Checks that rows outside of catalog referenced by imported tables exist in this database,
+    so import fails before anything is written instead of failing on constraint in the middle of COPY
+    """
+    for model in CATALOG_MODELS:
+        description: dict = manifest['models'][model.__name__]
+        for field in get_external_foreign_keys(model):
+            if field.attname in overrides:
+                continue
+
+            referenced: set = set()
+            for part_name in description['parts']:
+                column = pq.read_table(os.path.join(directory, description['table'], part_name),
+                                       columns=[field.attname]).column(0)
+                referenced.update(value for value in column.unique().to_pylist() if value is not None)
+
+            existing: set = set(field.related_model._base_manager.filter(pk__in=referenced)
+                                .values_list('pk', flat=True)) if referenced else set()
+            missing: list = sorted(referenced - existing)
+            if missing:
+                raise ValueError(
+                    f'{model.__name__}.{field.name} references {len(missing)} missing '
+                    f'{field.related_model.__name__} rows, for example {missing[:10]}'
+                )
+
+
+def import_model(model: Type[models.Model], directory: str, description: dict, batch_size: int,
+                 overrides: dict = None) -> int:
+    """
+    Streams Parquet parts of model into its table with COPY on PostgreSQL and bulk insert elsewhere,
+    overrides replace values of indicated columns in all rows
+    """
+    rows_count: int = 0
+    applied: dict = {column: value for column, value in (overrides or {}).items() if column in description['columns']}
+    for part_name in description['parts']:
+        parquet_file = pq.ParquetFile(os.path.join(directory, description['table'], part_name))
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            rows: list = batch.to_pylist()
+            if applied:
+                for row in rows:
+                    row.update(applied)
+            if connection.vendor == 'postgresql':
+                copy_rows(model, batch.schema.names, rows)
+            else:
+                insert_rows(model, rows)
+            rows_count += len(rows)
+
+    return rows_count
+
+
+def read_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, MANIFEST_NAME)) as file:
+        return json.load(file)
+
+
+def import_catalog(directory: str, batch_size: int, overrides: dict = None) -> dict:
+    """
+    Imports exported catalog, overrides replace values of indicated columns, for example creators of products
+    which do not exist in this database. References outside of catalog have to be checked beforehand
+    with check_foreign_keys
+    """
+    manifest: dict = read_manifest(directory)
+
+    imported: dict = {}
+    with transaction.atomic():
+        for model in CATALOG_MODELS:
+            imported[model.__name__] = import_model(model, directory, manifest['models'][model.__name__], batch_size,
+                                                    overrides)
+
+        # explicit primary keys were inserted, so sequences have to continue after them
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), CATALOG_MODELS):
+                cursor.execute(sql)
+
+    return imported
@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Type
+
+from django.db.models import Model, Q, Subquery
+
+from products.aggregators import BaseAggregator
+from products.definers import BaseDefiner, ProductDefiner
+
+# maximal amount of compiled plans kept in memory of each process
+PLAN_CACHE_SIZE = 64
+
+
+class ComparisonPlan:
+    """
+    Field groups, annotations and exclusions compiled once for certain set of fields and reused between requests
+    """
+
+    def __init__(self, fields: tuple[str, ...], definer_class: Type[BaseDefiner] = ProductDefiner,
+                 aggregator_class: Type[BaseAggregator] = BaseAggregator) -> None:
+        self.fields: tuple[str, ...] = fields
+
+        definer = definer_class(list(fields))
+        if not definer.is_valid:
+            raise KeyError(definer.errors)
+
+        self.definer_response: dict[Type[Model], dict[str, tuple]] = definer.response
+        self.aggregator: BaseAggregator = aggregator_class(self.definer_response)
+
+    @property
+    def annotations(self) -> dict[Type[Model], dict[str, Subquery]]:
+        return self.aggregator.response['annotations']
+
+    @property
+    def exclusions(self) -> dict[str, list[Q]]:
+        return self.aggregator.response['exclusions']
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_comparison_plan(fields: tuple[str, ...], definer_class: Type[BaseDefiner],
+                            aggregator_class: Type[BaseAggregator]) -> ComparisonPlan:
+    return ComparisonPlan(fields, definer_class, aggregator_class)
+
+
+def get_comparison_plan(fields: list, definer_class: Type[BaseDefiner] = ProductDefiner,
+                        aggregator_class: Type[BaseAggregator] = BaseAggregator) -> ComparisonPlan:
+    """
+    Returns compiled plan for canonical (sorted and deduplicated) set of fields.
+    Raises KeyError if there are wrong fields, such plans are not cached
+    """
+    return compile_comparison_plan(tuple(sorted(set(fields))), definer_class, aggregator_class)
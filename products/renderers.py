@@ -0,0 +1,77 @@
+from django.db import connections
+from django.db.models import QuerySet
+
+
+class ComparisonDiffRenderer:
+    """
+    Renders the whole comparison response as JSON with single PostgreSQL query. Each row becomes jsonb object
+    which contains compared fields only when local and remote values differ, rows of each group are
+    collected with json_agg, so web process receives ready response instead of all value pairs
+    """
+
+    def __init__(self, group_querysets: dict[str, QuerySet], group_field_names: dict[str, tuple[tuple, str]]) -> None:
+        self.group_querysets: dict[str, QuerySet] = group_querysets
+        self.group_field_names: dict[str, tuple[tuple, str]] = group_field_names
+
+        # all groups are read from the same database, which is chosen by router
+        self.db: str = next(iter(group_querysets.values())).db if group_querysets else 'default'
+        self.connection = connections[self.db]
+
+    @property
+    def is_supported(self) -> bool:
+        return self.connection.vendor == 'postgresql'
+
+    @staticmethod
+    def get_column_names(queryset: QuerySet) -> list[str]:
+        # the same order in which compiler puts columns of values() queryset into SELECT
+        query = queryset.query
+        return [*query.extra_select, *query.values_select, *query.annotation_select]
+
+    def get_group_sql(self, key: str) -> tuple[str, list]:
+        queryset: QuerySet = self.group_querysets[key]
+        field_names, auxiliary_model_name = self.group_field_names[key]
+
+        column_names: list[str] = self.get_column_names(queryset)
+        aliases: dict[str, str] = {name: f'c{index}' for index, name in enumerate(column_names)}
+        compared_names: set = {
+            name for field_name in field_names for name in (field_name, f'{auxiliary_model_name}__{field_name}')
+        }
+
+        # columns which are not compared are always present in row
+        core_names: list[str] = [name for name in column_names if name not in compared_names]
+        parts: list[str] = [
+            'jsonb_build_object(' + ', '.join(f'%s::text, s.{aliases[name]}' for name in core_names) + ')'
+        ]
+        params: list = [*core_names]
+
+        for field_name in field_names:
+            related_field_name = f'{auxiliary_model_name}__{field_name}'
+            field_alias, related_alias = aliases[field_name], aliases[related_field_name]
+            parts.append(
+                f'CASE WHEN s.{field_alias} IS DISTINCT FROM s.{related_alias} '
+                f'THEN jsonb_build_object(%s::text, s.{field_alias}, %s::text, s.{related_alias}) '
+                f"ELSE '{{}}'::jsonb END"
+            )
+            params.extend((field_name, related_field_name))
+
+        sql, query_params = queryset.query.sql_with_params()
+        return (
+            f"SELECT COALESCE(json_agg({' || '.join(parts)}), '[]'::json) "
+            f"FROM ({sql}) AS s ({', '.join(aliases.values())})",
+            [*params, *query_params]
+        )
+
+    def render(self) -> str:
+        if not self.group_querysets:
+            return '{}'
+
+        parts: list[str] = []
+        params: list = []
+        for key in self.group_querysets.keys():
+            sql, group_params = self.get_group_sql(key)
+            parts.append(f'%s::text, ({sql})')
+            params.extend((key, *group_params))
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"SELECT json_build_object({', '.join(parts)})::text", params)
+            return cursor.fetchone()[0]
@@ -2,6 +2,9 @@ from rest_framework.serializers import ModelSerializer
 
 from products.models import Image, Product
 
+# fields which are used internally for detecting changes and sharding
+FINGERPRINT_FIELDS = ['name_fingerprint', 'size_fingerprint', 'images_fingerprint', 'value_hash']
+
 
 class ImageListSerializer(ModelSerializer):
 
@@ -13,16 +16,24 @@ class ImageListSerializer(ModelSerializer):
 class ProductListSerializer(ModelSerializer):
     images = ImageListSerializer(source='image_set', many=True)
 
+    def __init__(self, *args, fields: list = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        # only requested fields are serialized if they are indicated
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
     class Meta:
         model = Product
-        exclude = ['creator']
+        exclude = ['creator', *FINGERPRINT_FIELDS]
 
 
 class ProductCreateUpdateSerializer(ModelSerializer):
 
     class Meta:
         model = Product
-        exclude = ['creator']
+        exclude = ['creator', *FINGERPRINT_FIELDS]
 
     def create(self, validated_data: dict) -> Product:
         product = Product.objects.create(
@@ -37,3 +48,16 @@ class ProductCreateUpdateSerializer(ModelSerializer):
 
         instance.save()
         return instance
+
+
+class ProductBulkItemSerializer(ModelSerializer):
+    """
+    Validates single item of bulk payload, uniqueness of values is checked for the whole batch at once
+    """
+
+    class Meta:
+        model = Product
+        exclude = ['creator', *FINGERPRINT_FIELDS]
+        extra_kwargs = {
+            'value': {'validators': []}
+        }
@@ -0,0 +1,47 @@
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from products.barcodes import record_barcode_changes
+from products.caching import invalidate_products
+from products.models import Image, Product, ProductRemote
+from users.models import User
+
+# there are no delete receivers of products and images, they would disable fast deletion of querysets,
+# so deleted products are invalidated by code which deletes them
+
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=ProductRemote)
+def remember_product_value(sender, instance: Product, **kwargs) -> None:
+    # value could be changed by update, so product is invalidated by the value it was loaded with as well;
+    # deferred value is not loaded here
+    instance._loaded_value = instance.__dict__.get('value')
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product(sender, instance: Product, **kwargs) -> None:
+    invalidate_products((instance.value, instance._loaded_value))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductRemote)
+def update_barcode_index(sender, instance: Product | ProductRemote, created: bool, **kwargs) -> None:
+    if created or instance.value != instance._loaded_value:
+        record_barcode_changes(added=(instance.value,), removed=() if created else (instance._loaded_value,),
+                               remote=instance.is_remote)
+
+
+@receiver(post_save, sender=Image)
+def invalidate_image_product(sender, instance: Image, **kwargs) -> None:
+    if Image.product.is_cached(instance):
+        invalidate_products((instance.product.value,))
+    else:
+        invalidate_products(Product.objects.filter(pk=instance.product_id).values_list('value', flat=True))
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_creator_products(sender, instance: User, **kwargs) -> None:
+    # products of user are removed by cascade
+    values: list = list(Product.objects.filter(creator=instance).values_list('value', flat=True))
+    invalidate_products(values)
+    record_barcode_changes(removed=values)
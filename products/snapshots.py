@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Iterable
+
+import numpy as np
+from django.conf import settings
+
+from products.models import ImageRemote, ProductRemote
+
+# name of file with version of snapshot that is currently used
+CURRENT_FILE_NAME = 'current'
+
+# amount of previous versions kept for processes which still map them
+KEPT_VERSIONS = 2
+
+# separator of value and alt in keys of images
+IMAGE_KEY_SEPARATOR = '\x1f'
+
+
+def form_image_keys(values: Iterable[str], alts: Iterable[str]) -> list[str]:
+    return [f'{value}{IMAGE_KEY_SEPARATOR}{alt}' for value, alt in zip(values, alts)]
+
+
+def write_remote_snapshot(products: list[dict], images: list[dict]) -> str:
+    """
+    Writes columnar snapshot of remote catalog as .npy files, which are mapped read-only by web
+    and celery processes. Products are dicts with id, value, name and sizes, images are dicts with
+    id of product, alt and hash. Returns version of written snapshot
+    """
+    snapshot_dir: str = str(settings.REMOTE_SNAPSHOT_DIR)
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    values = np.array([str(product['value']) for product in products], dtype=str)
+    order = np.argsort(values, kind='stable')
+    names, name_ids = np.unique(np.array([product['name'] for product in products], dtype=str),
+                                return_inverse=True)
+
+    values_by_id: dict = {product['id']: str(product['value']) for product in products}
+    images = [image for image in images if image['product'] in values_by_id]
+    image_keys = np.array(form_image_keys([values_by_id[image['product']] for image in images],
+                                          [image['alt'] for image in images]), dtype=str)
+    image_order = np.argsort(image_keys, kind='stable')
+
+    columns: dict[str, np.ndarray] = {
+        'values': values[order],
+        'name_ids': name_ids.astype(np.int32)[order],
+        'names': names,
+        'width': np.array([product['width'] for product in products], dtype=np.float64)[order],
+        'height': np.array([product['height'] for product in products], dtype=np.float64)[order],
+        'depth': np.array([product['depth'] for product in products], dtype=np.float64)[order],
+        'image_keys': image_keys[image_order],
+        'image_hashes': np.array([image['hash'] for image in images], dtype='U32')[image_order],
+    }
+
+    # files are written to new directory and published by atomic replace of version file
+    version: str = uuid.uuid4().hex
+    version_dir: str = os.path.join(snapshot_dir, version)
+    os.makedirs(version_dir)
+    for name, column in columns.items():
+        np.save(os.path.join(version_dir, f'{name}.npy'), column)
+
+    with tempfile.NamedTemporaryFile('w', dir=snapshot_dir, delete=False) as file:
+        file.write(version)
+    os.replace(file.name, os.path.join(snapshot_dir, CURRENT_FILE_NAME))
+
+    remove_old_versions(snapshot_dir, version)
+    return version
+
+
+def write_remote_snapshot_from_database() -> str:
+    products: list = list(ProductRemote.objects.values('id', 'value', 'name', 'width', 'height', 'depth'))
+    images: list = list(ImageRemote.objects.values('product', 'alt', 'hash'))
+    return write_remote_snapshot(products, images)
+
+
+def remove_old_versions(snapshot_dir: str, current_version: str) -> None:
+    versions: list = sorted(
+        (entry for entry in os.scandir(snapshot_dir) if entry.is_dir() and entry.name != current_version),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+
+    # mapped files stay readable after removing on posix systems
+    for entry in versions[KEPT_VERSIONS - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class RemoteSnapshot:
+    """
+    Read-only memory-mapped columns of remote catalog, pages are shared between processes
+    """
+
+    def __init__(self, version: str, version_dir: str) -> None:
+        self.version: str = version
+        for name in ('values', 'name_ids', 'names', 'width', 'height', 'depth', 'image_keys', 'image_hashes'):
+            setattr(self, name, np.load(os.path.join(version_dir, f'{name}.npy'), mmap_mode='r'))
+
+    @staticmethod
+    def lookup(sorted_column: np.ndarray, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns positions of keys in sorted column and mask of found keys
+        """
+        if not len(sorted_column):
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+
+        positions = np.searchsorted(sorted_column, keys)
+        positions = np.minimum(positions, len(sorted_column) - 1)
+        return positions, sorted_column[positions] == keys
+
+    def compare_products(self, products: list[tuple], groups: dict[str, tuple]) -> dict[str, list]:
+        """
+        Compares local products (value, name, width, height, depth) with remote ones,
+        returns the same structure as comparison from database
+        """
+        response: dict = {key: [] for key in groups}
+        if not products or not len(self.values):
+            return response
+
+        local = dict(zip(('value', 'name', 'width', 'height', 'depth'), map(np.array, zip(*products))))
+        local['value'] = local['value'].astype(str)
+        local['name'] = local['name'].astype(str)
+        positions, found = self.lookup(self.values, local['value'])
+        remote: dict = {
+            'name': self.names[self.name_ids[positions]],
+            'width': self.width[positions],
+            'height': self.height[positions],
+            'depth': self.depth[positions],
+        }
+
+        for key, field_names in groups.items():
+            changed: dict = {name: found & (local[name] != remote[name]) for name in field_names}
+            rows = np.flatnonzero(np.logical_or.reduce(list(changed.values())))
+
+            for row in rows:
+                instance: dict = {'value': str(local['value'][row])}
+                for name in field_names:
+                    if changed[name][row]:
+                        instance[name] = local[name][row].item()
+                        instance[f'productremote__{name}'] = remote[name][row].item()
+                response[key].append(instance)
+
+        return response
+
+    def compare_images(self, images: list[tuple]) -> list[dict]:
+        """
+        Compares local images (value of product, alt, hash) with remote ones
+        """
+        if not images or not len(self.image_keys):
+            return []
+
+        values, alts, hashes = map(np.array, zip(*images))
+        positions, found = self.lookup(self.image_keys, np.array(form_image_keys(values, alts), dtype=str))
+        remote_hashes = self.image_hashes[positions]
+        rows = np.flatnonzero(found & (hashes.astype(str) != remote_hashes))
+
+        return [
+            {
+                'product__value': str(values[row]),
+                'alt': str(alts[row]),
+                'hash': str(hashes[row]),
+                'imageremote__hash': str(remote_hashes[row]),
+            }
+            for row in rows
+        ]
+
+
+_snapshot: RemoteSnapshot | None = None
+
+
+def get_remote_snapshot() -> RemoteSnapshot | None:
+    """
+    Returns mapped snapshot of current version, it is mapped again only when new version is written
+    """
+    global _snapshot
+
+    snapshot_dir: str = str(settings.REMOTE_SNAPSHOT_DIR)
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE_NAME)) as file:
+            version: str = file.read().strip()
+    except FileNotFoundError:
+        return None
+
+    if not _snapshot or _snapshot.version != version:
+        try:
+            _snapshot = RemoteSnapshot(version, os.path.join(snapshot_dir, version))
+        except FileNotFoundError:
+            return None
+
+    return _snapshot
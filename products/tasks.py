@@ -1,107 +1,427 @@
 import datetime
 import os.path
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import Union
+from itertools import islice
+from typing import Type, Union
 
 import pytz
-import requests
+from django.conf import settings
 from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 from product_project import app
-from product_project.settings import AUTH_TOKEN
-from products.functions import (extract_photos_from_products, form_cache_key,
-                                get_image_base64md5, update_image_model,
+from products.caching import invalidate_products
+from products.functions import (bump_catalog_version,
+                                extract_photos_from_products,
+                                fetch_remote_products, filter_by_values,
+                                form_cache_key, get_shard_hash_range,
+                                read_image_metadata, update_image_model,
                                 update_product_model)
-from products.models import Image, ImageRemote, Product, ProductRemote
+from products.locks import (LOCK_RETRY_COUNTDOWN, acquire_renew_lock,
+                            finish_renew_batch, form_task_lock_key,
+                            hand_over_renew_lock, has_active_sync_jobs,
+                            release_renew_lock, running_sync_job)
+from products.media import iterate_media_files
+from products.models import (Image, ImageRemote, OutboxEvent, Product,
+                             ProductRemote)
+from products.outbox import (form_event, get_outbox_publisher,
+                             publish_outbox_batch, record_event)
+from products.snapshots import (write_remote_snapshot,
+                                write_remote_snapshot_from_database)
 
 kyiv_timezone = pytz.timezone('Europe/Kiev')
 
+# amount of images fetched by single task on I/O queue
+IMAGE_BATCH_SIZE = 100
 
-@app.task()
-def renew_database() -> None:
-    print(f'Starting updating database {datetime.datetime.now(tz=kyiv_timezone)}...')
-    barcode_list: list = [str(item[0]) for item in ProductRemote.objects.all().values_list('value')]
-    barcodes_to_request: str = ','.join(barcode_list)
-    response_photo = requests.get(f'https://ps-dev.datawiz.io/uk/api/v1/barcode/?value={barcodes_to_request}',
-                                  headers={
-                                      'Authorization': AUTH_TOKEN
-                                  })
+# amount of files removed by single task on I/O queue and by how many threads at once
+MEDIA_DELETE_BATCH_SIZE = 1000
+MEDIA_DELETE_CONCURRENCY = 16
+
+# counter of started shards, the next shard is chosen by it
+RENEW_SHARD_CURSOR_KEY = 'products:renew-shard-cursor'
 
-    response_data: list = response_photo.json()
+# set while filling of metadata of never verified images is queued or running, so it is started once;
+# it expires if chain of batches is broken and is started again by the next verifying
+BACKFILL_IMAGE_METADATA_KEY = 'products:backfill-image-metadata'
+BACKFILL_IMAGE_METADATA_TIMEOUT = 60 * 60
 
+
+def renew_products(response_data: list, lock_id: str) -> tuple[list, list]:
+    """
+    Updates remote and local products by response of remote API and queues updating of their images.
+    If any image batch is queued, renew lock is released by the last finished batch instead of caller
+    """
     response_data, images = extract_photos_from_products(response_data)
 
     # updating remote databases firstly
     print('Updating remote databases...')
     update_product_model(ProductRemote, response_data)
-    update_image_model(ImageRemote, images)
 
-    # updating customer's databases afterward
+    # updating customer's databases afterward, barcodes of created products are published to indexes by signals
     print('Updating local databases...')
     update_product_model(Product, response_data, use_creators=True)
-    update_image_model(Image, images)
+
+    # downloading of images is network-bound, so it is performed in batches on separate queue
+    print('Queueing updating of images...')
+    batches: list = [images[start:start + IMAGE_BATCH_SIZE] for start in range(0, len(images), IMAGE_BATCH_SIZE)]
+
+    # synchronization of images must not run while batches write images, so they hold renew lock
+    if batches:
+        hand_over_renew_lock(lock_id, len(batches) * 2)
+    for batch in batches:
+        update_images_batch.delay(ImageRemote.__name__, batch, lock_id)
+        update_images_batch.delay(Image.__name__, batch, lock_id)
+
+    return response_data, images
+
+
+@app.task(bind=True, max_retries=None)
+def renew_database(self) -> None:
+    lock_id: str = self.request.id or uuid.uuid4().hex
+    if not acquire_renew_lock(lock_id):
+        print('Database is already being updated.')
+        return
+
+    # renewal touches the whole catalog, so it waits for running synchronization jobs
+    if has_active_sync_jobs():
+        release_renew_lock(lock_id)
+        raise self.retry(countdown=LOCK_RETRY_COUNTDOWN)
+
+    images: list = []
+    try:
+        print(f'Starting updating database {datetime.datetime.now(tz=kyiv_timezone)}...')
+        barcode_list: list = [str(item[0]) for item in ProductRemote.objects.all().values_list('value')]
+        response_data, images = renew_products(fetch_remote_products(barcode_list), lock_id)
+
+        # remote catalog changes only here, so its snapshot is rewritten for fast comparisons
+        try:
+            write_remote_snapshot(response_data, images)
+        except OSError as error:
+            print(f'Snapshot of remote catalog was not written: {error}')
+
+        bump_catalog_version()
+    finally:
+        # otherwise lock is released by the last image batch
+        if not images:
+            release_renew_lock(lock_id)
 
 
 @app.task()
-def update_certain_products(product_values: Union[list[str], None], fields: list[str]) -> None:
+def renew_next_shard() -> None:
     """
-    Perform updating of certain queryset of products by indicated fields
+    Started by beat in 'sharded' renew mode, queues renewal of the next shard with random delay
+    """
+    cache.add(RENEW_SHARD_CURSOR_KEY, -1, timeout=None)
+    shard: int = cache.incr(RENEW_SHARD_CURSOR_KEY) % settings.RENEW_SHARD_COUNT
+    renew_database_shard.apply_async(args=(shard,), countdown=random.uniform(0, settings.RENEW_SHARD_JITTER_SECONDS))
+
+
+@app.task(bind=True, max_retries=None)
+def renew_database_shard(self, shard: int) -> None:
     """
+    Renews products whose barcodes belong to indicated shard, remote API is requested by several threads
+    """
+    lock_id: str = self.request.id or uuid.uuid4().hex
+
+    # shards share the lock with renewal of the whole database, so they never run simultaneously
+    if not acquire_renew_lock(lock_id):
+        raise self.retry(countdown=LOCK_RETRY_COUNTDOWN)
 
-    cache_key = form_cache_key(ProductRemote, product_values, fields)
-    remote_product_qs = cache.get(cache_key)
+    if has_active_sync_jobs():
+        release_renew_lock(lock_id)
+        raise self.retry(countdown=LOCK_RETRY_COUNTDOWN)
 
-    if not product_values:
-        products = Product.objects.all()
-        if not remote_product_qs:
-            remote_product_qs = ProductRemote.objects.all()
-            cache.set(cache_key, remote_product_qs, 60 * 15)
-    else:
-        products = Product.objects.filter(value__in=product_values)
-        if not remote_product_qs:
-            remote_product_qs = ProductRemote.objects.filter(value__in=product_values)
-            cache.set(cache_key, remote_product_qs, 60 * 15)
+    images: list = []
+    try:
+        print(f'Starting updating shard {shard} of database {datetime.datetime.now(tz=kyiv_timezone)}...')
+        first_hash, next_hash = get_shard_hash_range(shard, settings.RENEW_SHARD_COUNT)
+        barcode_list: list = list(
+            ProductRemote.objects.filter(value_hash__gte=first_hash, value_hash__lt=next_hash)
+            .values_list('value', flat=True)
+        )
+        _, images = renew_products(fetch_remote_products(barcode_list, settings.RENEW_REQUEST_CHUNK_SIZE,
+                                                         settings.RENEW_SHARD_CONCURRENCY), lock_id)
 
-    for product in products:
+        # response contains only part of catalog, so snapshot is written from database
         try:
+            write_remote_snapshot_from_database()
+        except OSError as error:
+            print(f'Snapshot of remote catalog was not written: {error}')
+
+        bump_catalog_version()
+    finally:
+        # otherwise lock is released by the last image batch
+        if not images:
+            release_renew_lock(lock_id)
+
+
+@app.task()
+def update_images_batch(model_name: str, images: list[dict], renew_lock_id: str = None) -> None:
+    """
+    Fetches and updates batch of images, routed to I/O queue
+    """
+    model = {Image.__name__: Image, ImageRemote.__name__: ImageRemote}[model_name]
+    try:
+        update_image_model(model, images)
+        bump_catalog_version()
+    finally:
+        if renew_lock_id:
+            finish_renew_batch(renew_lock_id)
+
+
+def refresh_images_metadata(model: Type[Union[Image, ImageRemote]], images: list[Union[Image, ImageRemote]]) -> None:
+    """
+    Reads files of images and stores their metadata, images with missing files are marked as verified as well
+    """
+    missing_events: list[OutboxEvent] = []
+    for image in images:
+        try:
+            with image.photo.open('rb') as file:
+                image.set_metadata(read_image_metadata(BytesIO(file.read())))
+        except (FileNotFoundError, ValueError):
+            print(f'File of image {image.pk} ({model.__name__}) is missing.')
+
+            # stored metadata does not describe any file anymore, so it is cleared and consumers are told
+            # about missing file once, when metadata is cleared
+            has_metadata: bool = image.size is not None or bool(image.mime_type)
+            image.set_metadata({'mime_type': '', 'verified_at': timezone.now()})
+            if has_metadata:
+                event: OutboxEvent = form_event(image, OutboxEvent.ACTION_UPDATED, image.metadata_fields)
+                event.payload['file_missing'] = True
+                missing_events.append(event)
+
+    with transaction.atomic():
+        model.objects.bulk_update(images, model.metadata_fields)
+        OutboxEvent.objects.bulk_create(missing_events)
+
+    # bulk update does not send signals, so retrieved products with these images are invalidated here
+    if model is Image:
+        invalidate_products(
+            Product.objects.filter(pk__in={image.product_id for image in images}).values_list('value', flat=True)
+        )
+
+
+@app.task()
+def verify_images(batch_size: int = 500, max_age_days: int = 7) -> None:
+    """
+    Lazily re-checks files of images which were not verified for a long time and refreshes their metadata
+    """
+    verified_before = timezone.now() - datetime.timedelta(days=max_age_days)
+
+    for model in (Image, ImageRemote):
+        refresh_images_metadata(model, list(
+            model.objects.filter(Q(verified_at__isnull=True) | Q(verified_at__lt=verified_before))
+            .order_by(F('verified_at').asc(nulls_first=True))[:batch_size]
+        ))
+
+    # images stored before metadata was kept have never been verified, all of them are filled in
+    # by separate task instead of waiting for hourly batches
+    if any(model.objects.filter(verified_at__isnull=True).exists() for model in (Image, ImageRemote)) \
+            and cache.add(BACKFILL_IMAGE_METADATA_KEY, True, BACKFILL_IMAGE_METADATA_TIMEOUT):
+        backfill_image_metadata.delay(batch_size)
+
+
+@app.task()
+def backfill_image_metadata(batch_size: int = 500) -> None:
+    """
+    One-off filling of metadata of images stored before it was kept (migration 0010). Each task reads files
+    of single batch and queues the next one until no image is left unverified. It is queued by verify_images,
+    manually it could be started with:
+
+    python manage.py shell -c "from products.tasks import backfill_image_metadata; backfill_image_metadata.delay()"
+    """
+    processed: int = 0
+    for model in (Image, ImageRemote):
+        images: list = list(model.objects.filter(verified_at__isnull=True).order_by('pk')[:batch_size])
+        refresh_images_metadata(model, images)
+        processed += len(images)
+
+    if not processed:
+        cache.delete(BACKFILL_IMAGE_METADATA_KEY)
+        print('Filling of image metadata is finished.')
+        return
+
+    cache.set(BACKFILL_IMAGE_METADATA_KEY, True, BACKFILL_IMAGE_METADATA_TIMEOUT)
+    backfill_image_metadata.delay(batch_size)
+
+
+@app.task(bind=True, max_retries=None)
+def update_certain_products(self, product_values: Union[list[str], None], fields: list[str]) -> None:
+    """
+    Perform updating of certain queryset of products by indicated fields
+    """
+
+    # job waits while renewal of the whole database is running
+    with running_sync_job(self, form_task_lock_key(Product, product_values, fields)):
+        cache_key = form_cache_key(ProductRemote, product_values, fields)
+        remote_product_qs = cache.get(cache_key)
+
+        if not product_values:
+            products = Product.objects.all()
+            if not remote_product_qs:
+                remote_product_qs = ProductRemote.objects.all()
+                cache.set(cache_key, remote_product_qs, 60 * 15)
+        else:
+            products = filter_by_values(Product.objects.all(), 'value', product_values)
+            if not remote_product_qs:
+                remote_product_qs = filter_by_values(ProductRemote.objects.all(), 'value', product_values)
+                cache.set(cache_key, remote_product_qs, 60 * 15)
+
+        remote_products: dict = {product_remote.value: product_remote for product_remote in remote_product_qs}
+
+        # fingerprints of field groups allow to skip products whose indicated fields have not changed
+        groups: list = [
+            group for group, group_fields in Product.fingerprint_groups.items() if set(group_fields) & set(fields)
+        ]
+        fields_covered: bool = set(fields) <= {
+            field for group in groups for field in Product.fingerprint_groups[group]
+        }
+
+        for product in products:
+            product_remote = remote_products.get(product.value)
+            if not product_remote:
+                continue
+
+            if groups and fields_covered and all(
+                getattr(product, f'{group}_fingerprint') == getattr(product_remote, f'{group}_fingerprint')
+                for group in groups
+            ):
+                continue
 
-            product_remote = ProductRemote.objects.get(value=product.value)
             for field in fields:
                 setattr(product, field, getattr(product_remote, field))
-            product.save()
-        except (Product.DoesNotExist, ProductRemote.DoesNotExist):
+            with transaction.atomic():
+                product.save(update_fields=fields)
+                record_event(product, OutboxEvent.ACTION_UPDATED, fields)
+
+        bump_catalog_version()
+
+
+@app.task(bind=True, max_retries=None)
+def update_certain_images(self, product_values: Union[list[str], None], fields: list[str]) -> None:
+    """
+    Perform updating of certain queryset of images by all fields
+    """
+
+    # job waits while renewal of the whole database is running
+    with running_sync_job(self, form_task_lock_key(Image, product_values, fields)):
+        if fields:
+            # perform some actions if needed with certain fields
             pass
 
+        cache_key = form_cache_key(ImageRemote, product_values, fields)
+        remote_image_qs = cache.get(cache_key)
+
+        if not product_values:
+            image_queryset = Image.objects.all()
+            if not remote_image_qs:
+                remote_image_qs = ImageRemote.objects.select_related('product').all()
+                cache.set(cache_key, remote_image_qs, 60 * 15)
+        else:
+            image_queryset = filter_by_values(Image.objects.all(), 'product__value', product_values)
+            if not remote_image_qs:
+                remote_image_qs = filter_by_values(ImageRemote.objects.select_related('product'), 'product__value',
+                                                   product_values)
+                cache.set(cache_key, remote_image_qs, 60 * 15)
+
+        remote_images: dict = {
+            (image_remote.product.value, image_remote.alt): image_remote for image_remote in remote_image_qs
+        }
+
+        for image in image_queryset.select_related('product'):
+            image_remote = remote_images.get((image.product.value, image.alt))
+            if not image_remote:
+                continue
+
+            # stored hash and metadata are compared instead of reading files
+            if image.hash == image_remote.hash and image.size == image_remote.size:
+                continue
+
+            image.photo.save(os.path.basename(image_remote.photo.name), image_remote.photo, save=False)
+            image.alt = image_remote.alt
+            image.hash = image_remote.hash
+            image.set_metadata({field: getattr(image_remote, field) for field in image_remote.metadata_fields})
+            with transaction.atomic():
+                image.save()
+                record_event(image, OutboxEvent.ACTION_UPDATED)
+
+        bump_catalog_version()
+
 
 @app.task()
-def update_certain_images(product_values: Union[list[str], None], fields: list[str]) -> None:
+def publish_outbox_events(max_batches: int = 100) -> None:
     """
-    Perform updating of certain queryset of images by all fields
+    Delivers recorded change events to consumers in batches and removes old published events
+    """
+    publisher = get_outbox_publisher()
+    for _ in range(max_batches):
+        if publish_outbox_batch(publisher, settings.OUTBOX_BATCH_SIZE) < settings.OUTBOX_BATCH_SIZE:
+            break
+
+    OutboxEvent.objects.filter(
+        published_at__lt=timezone.now() - datetime.timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    ).delete()
+
+
+@app.task()
+def delete_media_files(names: list[str]) -> None:
     """
-    if fields:
-        # perform some actions if needed with certain fields
-        pass
-
-    cache_key = form_cache_key(ImageRemote, product_values, fields)
-    remote_image_qs = cache.get(cache_key)
-
-    if not product_values:
-        image_queryset = Image.objects.all()
-        if not remote_image_qs:
-            remote_image_qs = ImageRemote.objects.select_related('product').all()
-            cache.set(cache_key, remote_image_qs, 60 * 15)
-    else:
-        image_queryset = Image.objects.filter(product__value__in=product_values)
-        if not remote_image_qs:
-            remote_image_qs = ImageRemote.objects.select_related('product').filter(product__value__in=product_values)
-            cache.set(cache_key, remote_image_qs, 60 * 15)
-
-    for image in image_queryset:
+    Removes files from media storage in parallel, routed to I/O queue
+    """
+    def delete_file(name: str) -> None:
         try:
-            image_remote = remote_image_qs.get(alt=image.alt, product__value=image.product.value)
-            image.photo.save(os.path.basename(image_remote.photo.name), image_remote.photo, save=True)
-            image.alt = image_remote.alt
-            image.hash = get_image_base64md5(BytesIO(image.photo.file.read()))
-            image.save()
-        except ImageRemote.DoesNotExist:
-            pass
+            default_storage.delete(name)
+        except OSError as error:
+            print(f'File {name} was not deleted: {error}')
+
+    with ThreadPoolExecutor(max_workers=MEDIA_DELETE_CONCURRENCY) as executor:
+        list(executor.map(delete_file, names))
+
+
+@app.task()
+def collect_orphaned_media(grace_hours: int = 24, dry_run: bool = False, rate_limit: float = 50,
+                           chunk_size: int = 1000) -> dict:
+    """
+    Removes photos which are referenced neither by Image nor by ImageRemote. Files are listed in chunks and
+    each chunk is checked against database, so memory does not depend on amount of files. Files younger than
+    grace period are kept, as their rows could be not committed yet. rate_limit is maximal deletions per second
+    """
+    directory: str = Image._meta.get_field('photo').upload_to.rstrip('/')
+    modified_before: float = time.time() - grace_hours * 60 * 60
+    result: dict = {'checked': 0, 'orphaned': 0, 'deleted': 0}
+
+    files = iterate_media_files(directory)
+    while chunk := list(islice(files, chunk_size)):
+        result['checked'] += len(chunk)
+        names: list = [name for name, modified in chunk if modified < modified_before]
+        if not names:
+            continue
+
+        referenced: set = set()
+        for model in (Image, ImageRemote):
+            referenced.update(filter_by_values(model.objects.all(), 'photo', names).values_list('photo', flat=True))
+
+        for name in names:
+            if name in referenced:
+                continue
+
+            result['orphaned'] += 1
+            if dry_run:
+                print(f'Orphaned file {name}')
+                continue
+
+            default_storage.delete(name)
+            result['deleted'] += 1
+            if rate_limit:
+                time.sleep(1 / rate_limit)
+
+    print(f'Collecting of orphaned media is finished: {result}')
+    return result
@@ -0,0 +1,835 @@
+import base64
+import datetime
+import json
+import os
+import tempfile
+import time
+from unittest import mock, skipUnless
+
+from celery.exceptions import Retry
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from PIL import Image as PillowImage
+from rest_framework.test import APIClient
+
+from product_project.local_cache import LocalCache
+from products import barcodes
+from products.barcodes import (BARCODE_INDEX_VERSION_KEY, MAX_APPLIED_CHANGES,
+                               BarcodeIndex, get_barcode_index,
+                               get_barcode_index_version,
+                               record_barcode_changes, split_known_values)
+from products.caching import local_products
+from products.filters import ProductFilter
+from products.functions import (bump_catalog_version, get_shard_hash_range,
+                                get_value_shard)
+from products.locks import (LOCK_RETRY_COUNTDOWN, acquire_renew_lock,
+                            acquire_task_lock, form_task_lock_key,
+                            has_active_sync_jobs, refresh_task_lock,
+                            release_renew_lock, running_sync_job)
+from products.media import parse_range
+from products.models import (Image, ImageRemote, OutboxEvent, Product,
+                             ProductRemote, form_value_hash)
+from products.outbox import (LocalStreamPublisher, publish_outbox_batch,
+                             record_event)
+from products.parquet import export_catalog
+from products.plans import ComparisonPlan, get_comparison_plan
+from products.renderers import ComparisonDiffRenderer
+from products.tasks import (BACKFILL_IMAGE_METADATA_KEY,
+                            backfill_image_metadata, delete_media_files,
+                            publish_outbox_events, renew_database_shard,
+                            renew_next_shard, update_certain_products,
+                            verify_images)
+from products.views import ProductViewSet
+from scripts import clear_db, import_catalog
+from users.models import User
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OUTBOX_PUBLISHER='products.outbox.LocalStreamPublisher',
+    OUTBOX_BATCH_SIZE=2,
+)
+class OutboxTestCase(TestCase):
+
+    def setUp(self) -> None:
+        LocalStreamPublisher.stream.clear()
+
+    @staticmethod
+    def create_product(value: str) -> Product:
+        with transaction.atomic():
+            product: Product = Product.objects.create(value=value, name='Product', width=1, height=2, depth=3)
+            record_event(product, OutboxEvent.ACTION_CREATED)
+        return product
+
+    def test_event_is_recorded_with_change(self) -> None:
+        product: Product = self.create_product('100')
+
+        event: OutboxEvent = OutboxEvent.objects.get()
+        self.assertEqual(event.model, 'product')
+        self.assertEqual(event.object_id, product.pk)
+        self.assertEqual(event.action, OutboxEvent.ACTION_CREATED)
+        self.assertEqual(event.payload['value'], '100')
+        self.assertIsNone(event.published_at)
+
+    def test_event_is_rolled_back_with_change(self) -> None:
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            product: Product = Product.objects.create(value='100', name='Product', width=1, height=2, depth=3)
+            record_event(product, OutboxEvent.ACTION_CREATED)
+            raise RuntimeError()
+
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_changed_fields_are_passed(self) -> None:
+        product: Product = self.create_product('100')
+        product.name = 'Renamed'
+        with transaction.atomic():
+            product.save(update_fields=['name'])
+            record_event(product, OutboxEvent.ACTION_UPDATED, ['name'])
+
+        event: OutboxEvent = OutboxEvent.objects.get(action=OutboxEvent.ACTION_UPDATED)
+        self.assertEqual(event.payload['name'], 'Renamed')
+        self.assertEqual(event.payload['changed_fields'], ['name'])
+
+    def test_batch_is_published_and_marked(self) -> None:
+        for value in ('100', '101', '102'):
+            self.create_product(value)
+
+        publisher = LocalStreamPublisher()
+        self.assertEqual(publish_outbox_batch(publisher, 2), 2)
+        self.assertEqual([message['id'] for message in LocalStreamPublisher.stream],
+                         [str(pk) for pk in OutboxEvent.objects.order_by('pk').values_list('pk', flat=True)[:2]])
+        self.assertEqual(OutboxEvent.objects.filter(published_at__isnull=False).count(), 2)
+
+        # already published events are not sent again
+        self.assertEqual(publish_outbox_batch(publisher, 2), 1)
+        self.assertEqual(publish_outbox_batch(publisher, 2), 0)
+        self.assertEqual(len(LocalStreamPublisher.stream), 3)
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+
+    def test_failed_publishing_is_retried(self) -> None:
+        self.create_product('100')
+
+        publisher = LocalStreamPublisher()
+        with mock.patch.object(LocalStreamPublisher, 'publish', side_effect=ConnectionError()):
+            with self.assertRaises(ConnectionError):
+                publish_outbox_batch(publisher, 2)
+
+        # events stay unpublished and are delivered by the next run
+        self.assertTrue(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+        self.assertEqual(publish_outbox_batch(publisher, 2), 1)
+        self.assertEqual(len(LocalStreamPublisher.stream), 1)
+
+    def test_task_publishes_all_batches_and_removes_old_events(self) -> None:
+        for value in ('100', '101', '102', '103', '104'):
+            self.create_product(value)
+        old_event: OutboxEvent = OutboxEvent.objects.create(
+            model='product', action=OutboxEvent.ACTION_DELETED,
+            published_at=timezone.now() - datetime.timedelta(days=30)
+        )
+
+        publish_outbox_events()
+
+        self.assertEqual(len(LocalStreamPublisher.stream), 5)
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+        self.assertFalse(OutboxEvent.objects.filter(pk=old_event.pk).exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ImportCatalogTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        for value in ('100', '101'):
+            product: Product = Product.objects.create(value=value, name='Product', width=1, height=2, depth=3)
+            Image.objects.create(product=product, alt='front', photo='photo/front.jpg', hash='hash')
+        export_catalog(self.directory.name, chunk_size=1000)
+
+    def test_failed_replace_keeps_existing_catalog(self) -> None:
+        Product.objects.create(value='102', name='Added after export', width=1, height=2, depth=3)
+        products: list = list(Product.objects.order_by('pk').values_list('pk', 'value'))
+
+        # products are imported before images, so failure happens after part of rows is written
+        image_table: str = os.path.join(self.directory.name, Image._meta.db_table)
+        for part_name in os.listdir(image_table):
+            with open(os.path.join(image_table, part_name), 'wb') as file:
+                file.write(b'broken')
+
+        with self.assertRaises(Exception):
+            import_catalog.run(self.directory.name, 'replace')
+
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('pk', 'value')), products)
+        self.assertEqual(Image.objects.count(), 2)
+        self.assertFalse(OutboxEvent.objects.filter(payload__all=True).exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ClearDbTestCase(TestCase):
+
+    def setUp(self) -> None:
+        product: Product = Product.objects.create(value='100', name='Product', width=1, height=2, depth=3)
+        Image.objects.create(product=product, alt='front', photo='photo/front.jpg', hash='hash')
+        OutboxEvent.objects.all().delete()
+
+    def test_both_modes_record_removal_of_whole_catalog(self) -> None:
+        for args in ((), ('fast',)):
+            with self.subTest(args=args), tempfile.TemporaryDirectory() as snapshot_dir, \
+                    override_settings(REMOTE_SNAPSHOT_DIR=snapshot_dir), \
+                    mock.patch.object(delete_media_files, 'delay'):
+                clear_db.run(*args)
+
+                self.assertFalse(Product.objects.exists())
+                self.assertEqual(list(OutboxEvent.objects.values_list('model', 'action', 'payload')),
+                                 [('product', OutboxEvent.ACTION_DELETED, {'all': True})])
+                OutboxEvent.objects.all().delete()
+
+
+class ProductFilterTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        for value, name, width in (('100', 'Green Tea', 1), ('101', 'Black tea', 2), ('102', 'Coffee', 3)):
+            Product.objects.create(value=value, name=name, width=width, height=2, depth=3)
+
+    @staticmethod
+    def filter_values(query: str) -> list[str]:
+        product_filter = ProductFilter(QueryDict(query))
+        return list(product_filter.filter_queryset(Product.objects.all()).values_list('value', flat=True))
+
+    def test_search_is_case_insensitive_substring(self) -> None:
+        self.assertEqual(self.filter_values('search=TEA'), ['100', '101'])
+        self.assertEqual(self.filter_values('search=ffe'), ['102'])
+        self.assertEqual(self.filter_values('search=%20%20'), ['100', '101', '102'])
+
+    def test_range_bounds_are_inclusive(self) -> None:
+        self.assertEqual(self.filter_values('width_min=2'), ['101', '102'])
+        self.assertEqual(self.filter_values('width_max=2'), ['100', '101'])
+        self.assertEqual(self.filter_values('width_min=1.5&width_max=2.5'), ['101'])
+        self.assertEqual(self.filter_values('volume_min=12&volume_max=12'), ['101'])
+
+    def test_non_numeric_and_non_finite_bounds_are_rejected(self) -> None:
+        for value in ('abc', 'nan', 'inf', '-Infinity', ''):
+            product_filter = ProductFilter(QueryDict(f'width_min={value}&height_max=5'))
+            self.assertFalse(product_filter.is_valid, value)
+            self.assertEqual(list(product_filter.errors), ['width_min'])
+
+    def test_ordering_accepts_only_indexed_fields(self) -> None:
+        self.assertEqual(self.filter_values('ordering=-width'), ['102', '101', '100'])
+        self.assertEqual(self.filter_values('ordering=name'), ['101', '102', '100'])
+
+        for ordering in ('creator', '-id,name', 'name,images_fingerprint'):
+            product_filter = ProductFilter(QueryDict(f'ordering={ordering}'))
+            self.assertFalse(product_filter.is_valid, ordering)
+            self.assertIn('ordering', product_filter.errors)
+            with self.assertRaises(AttributeError):
+                product_filter.filter_queryset(Product.objects.all())
+
+
+@override_settings(LOCAL_CACHE_TEST_SECONDS=10, LOCAL_CACHE_TEST_SIZE=2)
+class LocalCacheTestCase(TestCase):
+
+    def test_entries_expire(self) -> None:
+        local_cache = LocalCache('LOCAL_CACHE_TEST_SECONDS', 'LOCAL_CACHE_TEST_SIZE')
+        local_cache.set('a', 1, now=100)
+
+        self.assertEqual(local_cache.get('a', now=109), 1)
+        self.assertIsNone(local_cache.get('a', now=110))
+        self.assertNotIn('a', local_cache.entries)
+
+    def test_least_recently_used_entries_are_evicted(self) -> None:
+        local_cache = LocalCache('LOCAL_CACHE_TEST_SECONDS', 'LOCAL_CACHE_TEST_SIZE')
+        local_cache.set('a', 1, now=100)
+        local_cache.set('b', 2, now=100)
+        local_cache.get('a', now=101)
+        local_cache.set('c', 3, now=101)
+
+        self.assertEqual(list(local_cache.entries), ['a', 'c'])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OUTBOX_PUBLISHER='products.outbox.LocalStreamPublisher',
+    DATABASE_REPLICAS=[],
+)
+class RetrieveCacheTestCase(TransactionTestCase):
+    """
+    Invalidation is performed on commit, so changes are made in real transactions
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        local_products.clear()
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('user@example.com', 'password', name='a', surname='b'))
+        self.product: Product = Product.objects.create(value='100', name='Product', width=1, height=2, depth=3)
+
+    def retrieve(self, value: str = '100', **headers):
+        return self.client.get(f'/product/{value}/', **headers)
+
+    def test_retrieve_is_served_from_cache(self) -> None:
+        self.assertEqual(self.retrieve().data['name'], 'Product')
+
+        # update without signals is not seen, as product is not read again
+        Product.objects.filter(pk=self.product.pk).update(name='Changed')
+        with self.assertNumQueries(0):
+            response = self.retrieve()
+        self.assertEqual(response.data['name'], 'Product')
+
+        # shared tier serves other processes with empty local tier
+        local_products.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.retrieve().data['name'], 'Product')
+
+    def test_partial_update_invalidates_cache(self) -> None:
+        self.retrieve()
+        response = self.client.patch('/product/100/', {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.retrieve().data['name'], 'Renamed')
+
+    def test_bulk_update_invalidates_cache(self) -> None:
+        self.retrieve()
+        response = self.client.patch('/product/bulk/', [{'value': '100', 'width': 5}], format='json')
+        self.assertEqual(response.data, [{'value': '100', 'status': 'updated'}])
+
+        self.assertEqual(self.retrieve().data['width'], 5)
+
+    def test_bulk_destroy_and_destroy_invalidate_cache(self) -> None:
+        Product.objects.create(value='101', name='Product', width=1, height=2, depth=3)
+        self.retrieve('100')
+        self.retrieve('101')
+
+        self.client.delete('/product/bulk/', ['100'], format='json')
+        self.assertEqual(self.client.delete('/product/101/').status_code, 204)
+
+        self.assertEqual(self.retrieve('100').status_code, 400)
+        self.assertEqual(self.retrieve('101').status_code, 400)
+
+    def test_etag_is_formed_from_cached_entry(self) -> None:
+        etag: str = self.retrieve()['ETag']
+
+        # other change of catalog does not make cached entry and its ETag stale
+        bump_catalog_version()
+        self.assertEqual(self.retrieve()['ETag'], etag)
+        self.assertEqual(self.retrieve(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # stale body is never sent with ETag of the current version
+        Product.objects.filter(pk=self.product.pk).update(name='Changed')
+        self.client.patch('/product/100/', {'width': 7}, format='json')
+        response = self.retrieve(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual((response.data['name'], response.data['width']), ('Changed', 7))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    RENEW_SHARD_COUNT=3,
+)
+class RenewShardTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_shard_of_value_is_within_its_hash_range(self) -> None:
+        for shard_count in (1, 3, 24):
+            ranges: list = [get_shard_hash_range(shard, shard_count) for shard in range(shard_count)]
+
+            # ranges cover all hashes without gaps and overlaps
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], 2 ** 32)
+            self.assertEqual([first for first, _ in ranges[1:]], [next_hash for _, next_hash in ranges[:-1]])
+
+            for value in map(str, range(1000, 1200)):
+                first_hash, next_hash = ranges[get_value_shard(value, shard_count)]
+                self.assertTrue(first_hash <= form_value_hash(value) < next_hash, value)
+
+    def test_next_shard_is_rotated(self) -> None:
+        with mock.patch.object(renew_database_shard, 'apply_async') as apply_async:
+            for _ in range(7):
+                renew_next_shard()
+
+        self.assertEqual([call.kwargs['args'] for call in apply_async.call_args_list],
+                         [(0,), (1,), (2,), (0,), (1,), (2,), (0,)])
+
+    def test_shard_renews_only_its_values(self) -> None:
+        values: list = [str(value) for value in range(1000, 1030)]
+        for value in values:
+            ProductRemote.objects.create(value=value, name='Product', width=1, height=2, depth=3)
+
+        renewed: dict = {}
+        with tempfile.TemporaryDirectory() as snapshot_dir, override_settings(REMOTE_SNAPSHOT_DIR=snapshot_dir):
+            for shard in range(3):
+                with mock.patch('products.tasks.fetch_remote_products', return_value=[]) as fetch_remote_products:
+                    renew_database_shard(shard)
+                renewed[shard] = sorted(fetch_remote_products.call_args.args[0])
+
+        for shard, shard_values in renewed.items():
+            self.assertEqual(shard_values, sorted(value for value in values if get_value_shard(value, 3) == shard))
+        self.assertEqual(sorted(sum(renewed.values(), [])), values)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SyncLockTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('user@example.com', 'password', name='a', surname='b'))
+        self.lock_key: str = form_task_lock_key(Product, [], ['name'])
+
+    def synchronize(self):
+        return self.client.post('/product/synchronize/', {'fields': ['name']}, format='json')
+
+    @staticmethod
+    def form_task(task_id: str) -> mock.Mock:
+        return mock.Mock(request=mock.Mock(id=task_id), retry=mock.Mock(return_value=Retry()))
+
+    def test_same_jobs_are_coalesced(self) -> None:
+        with mock.patch.object(update_certain_products, 'apply_async') as apply_async:
+            first = self.synchronize().data['tasks']['product']
+            second = self.synchronize().data['tasks']['product']
+
+            self.assertEqual(apply_async.call_count, 1)
+            self.assertFalse(first['attached'])
+            self.assertEqual(second, {'id': first['id'], 'attached': True})
+
+            # finished job releases the lock, so the next request queues new job
+            with running_sync_job(self.form_task(first['id']), self.lock_key):
+                pass
+            third = self.synchronize().data['tasks']['product']
+
+        self.assertEqual(apply_async.call_count, 2)
+        self.assertNotEqual(third['id'], first['id'])
+
+    def test_lock_is_released_if_job_is_not_queued(self) -> None:
+        with mock.patch.object(update_certain_products, 'apply_async', side_effect=OperationalError):
+            self.assertEqual(self.synchronize().status_code, 503)
+        self.assertIsNone(cache.get(self.lock_key))
+
+        with mock.patch.object(update_certain_products, 'apply_async', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.synchronize()
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_job_waits_for_renewal_and_keeps_lock(self) -> None:
+        task = self.form_task(acquire_task_lock(self.lock_key, 'job'))
+        acquire_renew_lock('renewal')
+
+        with self.assertRaises(Retry):
+            with running_sync_job(task, self.lock_key):
+                self.fail('Job must not run during renewal.')
+
+        # retried job is still the holder, so the same requests are attached to it
+        task.retry.assert_called_once_with(countdown=LOCK_RETRY_COUNTDOWN)
+        self.assertEqual(acquire_task_lock(self.lock_key, 'other'), 'job')
+        self.assertFalse(has_active_sync_jobs())
+
+        release_renew_lock('renewal')
+        with running_sync_job(task, self.lock_key):
+            # renewal waits while synchronization jobs are running
+            self.assertTrue(has_active_sync_jobs())
+
+        self.assertFalse(has_active_sync_jobs())
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_failed_job_releases_lock(self) -> None:
+        task = self.form_task(acquire_task_lock(self.lock_key, 'job'))
+
+        with self.assertRaises(ValueError):
+            with running_sync_job(task, self.lock_key):
+                raise ValueError
+
+        self.assertIsNone(cache.get(self.lock_key))
+        self.assertFalse(has_active_sync_jobs())
+
+    def test_lock_is_refreshed_while_job_runs(self) -> None:
+        task = self.form_task(acquire_task_lock(self.lock_key, 'job'))
+
+        with mock.patch('products.locks.TASK_LOCK_REFRESH_INTERVAL', 0.01), \
+                mock.patch('products.locks.refresh_task_lock', wraps=refresh_task_lock) as refresh:
+            with running_sync_job(task, self.lock_key):
+                time.sleep(0.1)
+
+        self.assertGreater(refresh.call_count, 2)
+        refresh.assert_called_with(self.lock_key, 'job')
+
+        # lock of other job is not refreshed
+        cache.set(self.lock_key, 'other', 10)
+        refresh_task_lock(self.lock_key, 'job', 1000)
+        self.assertEqual(cache.get(self.lock_key), 'other')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    BARCODE_INDEX_SYNC_REBUILD=True,
+)
+class BarcodeIndexTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        patcher = mock.patch.object(barcodes, 'barcode_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_products(self, *values: str, remote: bool = True) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            for value in values:
+                Product.objects.create(value=value, name='Product', width=1, height=2, depth=3)
+                if remote:
+                    ProductRemote.objects.create(value=value, name='Product', width=1, height=2, depth=3)
+
+    def test_changes_are_applied(self) -> None:
+        index = BarcodeIndex.from_values(1, ['1', '2'], ['1', '2', '3'])
+        changed: BarcodeIndex = index.apply(2, False, {'3': True, '1': False}, {})
+
+        self.assertEqual(changed.split(['1', '2', '3', '4']), (['2', '3'], ['1', '4']))
+        # index used by other threads stays unchanged
+        self.assertEqual(index.split(['1', '2', '3']), (['1', '2'], ['3']))
+        self.assertEqual(index.apply(3, True, {'5': True}, {'5': True}).split(['1', '5']), (['5'], ['1']))
+
+    def test_published_changes_are_applied_without_database(self) -> None:
+        self.create_products('100', '101')
+        self.assertEqual(get_barcode_index().split(['100', '101']), (['100', '101'], []))
+
+        self.create_products('102')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(value='100').delete()
+            record_barcode_changes(removed=['100'])
+
+        with self.assertNumQueries(0):
+            index: BarcodeIndex = get_barcode_index()
+        self.assertEqual(index.version, get_barcode_index_version())
+        self.assertEqual(index.split(['100', '101', '102']), (['101', '102'], ['100']))
+
+    def test_version_gap_rebuilds_index(self) -> None:
+        self.create_products('100')
+        index: BarcodeIndex = get_barcode_index()
+
+        # changes written without publishing are seen only after rebuilding
+        Product.objects.bulk_create([Product(value='101', name='Product', width=1, height=2, depth=3)])
+        ProductRemote.objects.bulk_create([ProductRemote(value='101', name='Product', width=1, height=2, depth=3)])
+        cache.incr(BARCODE_INDEX_VERSION_KEY, MAX_APPLIED_CHANGES + 1)
+
+        with self.assertNumQueries(2):
+            rebuilt: BarcodeIndex = get_barcode_index()
+        self.assertEqual(rebuilt.version, index.version + MAX_APPLIED_CHANGES + 1)
+        self.assertEqual(rebuilt.split(['100', '101']), (['100', '101'], []))
+
+    def test_missing_change_rebuilds_index_after_delay(self) -> None:
+        index: BarcodeIndex = get_barcode_index()
+        cache.incr(BARCODE_INDEX_VERSION_KEY)
+
+        # change could be published right after the version, so it is awaited for a while
+        with self.assertNumQueries(0):
+            self.assertIs(get_barcode_index(), index)
+
+        index.built_at -= settings.BARCODE_INDEX_REBUILD_SECONDS
+        self.assertEqual(get_barcode_index().version, index.version + 1)
+
+    def test_values_missing_in_index_are_checked_with_database(self) -> None:
+        self.create_products('100')
+        get_barcode_index()
+
+        # products written without signals are not in index yet
+        Product.objects.bulk_create([Product(value=value, name='Product', width=1, height=2, depth=3)
+                                     for value in ('101', '102')])
+        ProductRemote.objects.bulk_create([ProductRemote(value='101', name='Product', width=1, height=2, depth=3)])
+
+        known, unknown = split_known_values(['102', '101', '103', '100'])
+        self.assertEqual(known, ['101', '100'])
+        self.assertEqual(unknown, ['102', '103'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ComparisonTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user: User = User.objects.create_user('user@example.com', 'password', name='a', surname='b')
+
+        # names of odd products differ, sizes of the last two products differ
+        for index in range(7):
+            value: str = str(100 + index)
+            Product.objects.create(value=value, name='Local', width=1, height=2, depth=3)
+            remote_product: ProductRemote = ProductRemote.objects.create(
+                value=value, name='Remote' if index % 2 else 'Local', width=1, height=9 if index >= 5 else 2, depth=3
+            )
+            if index < 2:
+                Image.objects.create(product=Product.objects.get(value=value), alt='front', photo='photo/a.jpg',
+                                     hash='local')
+                ImageRemote.objects.create(product=remote_product, alt='front', photo='photo/a.jpg',
+                                           hash='remote' if index else 'local')
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def compare(self, **params):
+        return self.client.get('/product/compare/', {'fields': 'name,size', **params})
+
+    def read_comparison(self, **params) -> dict:
+        # PostgreSQL renders the whole comparison itself, so content is read instead of data of Response
+        return json.loads(self.compare(**params).content)
+
+    def test_whole_comparison(self) -> None:
+        self.assertEqual(self.read_comparison(), {
+            'name': [{'value': value, 'name': 'Local', 'productremote__name': 'Remote'}
+                     for value in ('101', '103', '105')],
+            'size': [{'value': value, 'height': 2.0, 'productremote__height': 9.0} for value in ('105', '106')],
+        })
+
+    def test_cursor_pages_continue_each_other(self) -> None:
+        pages: list = []
+        params: dict = {'page_size': 2}
+        while True:
+            data: dict = self.read_comparison(**params)
+            pages.append(data['results'])
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+
+        # exhausted group is absent from the next pages
+        self.assertEqual([sorted(page.keys()) for page in pages], [['name', 'size'], ['name']])
+
+        rows: dict = {}
+        for page in pages:
+            for key, page_rows in page.items():
+                rows.setdefault(key, []).extend(page_rows)
+        self.assertEqual(rows, self.read_comparison())
+
+    def test_malformed_cursor_is_rejected(self) -> None:
+        cursors: list = [
+            'not a cursor',
+            base64.urlsafe_b64encode(b'[1, 2]').decode(),
+            base64.urlsafe_b64encode(b'{"name": "101"}').decode(),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.compare(page_size=2, cursor=cursor).status_code, 400)
+
+        self.assertEqual(self.compare(page_size=0).status_code, 400)
+
+    def test_streamed_comparison_equals_whole_one(self) -> None:
+        # chunks smaller than groups check separators between them
+        with mock.patch.object(ProductViewSet, 'comparison_stream_chunk_size', 2):
+            response = self.compare(stream='true')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), self.read_comparison())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Comparison is rendered by database only on PostgreSQL.')
+    def test_database_rendering_equals_python_one(self) -> None:
+        view = ProductViewSet()
+        view.value = []
+        plan: ComparisonPlan = get_comparison_plan(['images', 'name', 'size'], view.definer_class,
+                                                   view.aggregator_class)
+        query_dict: dict = view.get_changed_product_querysets(plan.aggregator)
+        group_querysets: dict = view.get_group_querysets(query_dict, plan.aggregator, plan.definer_response)
+
+        rendered: dict = json.loads(
+            ComparisonDiffRenderer(group_querysets, view.get_group_field_names(plan.definer_response)).render()
+        )
+        expected: dict = json.loads(json.dumps(
+            view.resolve_querysets_to_response(query_dict, plan.aggregator, plan.definer_response),
+            cls=DjangoJSONEncoder
+        ))
+
+        # rows of groups are not ordered by either of renderers
+        for comparison in (rendered, expected):
+            for rows in comparison.values():
+                rows.sort(key=lambda row: json.dumps(row, sort_keys=True))
+        self.assertEqual(rendered, expected)
+        self.assertEqual(len(expected['images']), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BulkTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user: User = User.objects.create_user('user@example.com', 'password', name='a', surname='b')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Product.objects.create(value='100', name='Product', width=1, height=2, depth=3)
+
+    @staticmethod
+    def form_item(value: str | None, **fields) -> dict:
+        return {'value': value, 'name': 'Product', 'width': 1, 'height': 2, 'depth': 3, **fields}
+
+    def test_create_reports_status_of_each_item(self) -> None:
+        response = self.client.post('/product/bulk/', [
+            self.form_item('200'),
+            self.form_item('100'),
+            self.form_item('201'),
+            self.form_item('201'),
+            self.form_item('202', width='wide'),
+        ], format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(result['value'], result['status']) for result in response.data], [
+            ('200', 'created'), ('100', 'invalid'), ('201', 'created'), ('201', 'invalid'), ('202', 'invalid'),
+        ])
+        self.assertIn('width', response.data[4]['errors'])
+        self.assertEqual(sorted(Product.objects.filter(creator=self.user).values_list('value', flat=True)),
+                         ['200', '201'])
+        self.assertEqual(OutboxEvent.objects.filter(action=OutboxEvent.ACTION_CREATED).count(), 2)
+
+    def test_create_falls_back_to_single_products_on_conflict(self) -> None:
+        # value created by concurrent request is not found by the check before writing
+        with mock.patch('products.bulk.filter_by_values', return_value=Product.objects.none()):
+            items: list = [self.form_item('200'), self.form_item('100'), self.form_item('201')]
+            response = self.client.post('/product/bulk/', items, format='json')
+
+        self.assertEqual([(result['value'], result['status']) for result in response.data],
+                         [('200', 'created'), ('100', 'invalid'), ('201', 'created')])
+        self.assertEqual(Product.objects.filter(value__in=['200', '201']).count(), 2)
+        self.assertEqual(OutboxEvent.objects.filter(action=OutboxEvent.ACTION_CREATED).count(), 2)
+
+    def test_size_of_payload_is_limited(self) -> None:
+        with mock.patch.object(ProductViewSet, 'bulk_max_size', 2):
+            for method in (self.client.post, self.client.patch, self.client.delete):
+                with self.subTest(method=method.__name__):
+                    response = method('/product/bulk/', [self.form_item(str(value)) for value in range(3)],
+                                      format='json')
+                    self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.client.post('/product/bulk/', self.form_item('200'), format='json').status_code, 400)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_update_reports_status_of_each_item(self) -> None:
+        response = self.client.patch('/product/bulk/', [
+            {'value': '100', 'width': 5},
+            {'value': '100', 'width': 6},
+            {'value': '300', 'width': 5},
+            {'width': 5},
+            {'value': '100', 'height': 'high'},
+        ], format='json')
+
+        self.assertEqual([(result['value'], result['status']) for result in response.data], [
+            ('100', 'updated'), ('100', 'invalid'), ('300', 'not_found'), (None, 'invalid'), ('100', 'invalid'),
+        ])
+        self.assertEqual(Product.objects.get(value='100').width, 5)
+
+    def test_destroy_reports_status_of_each_item(self) -> None:
+        response = self.client.delete('/product/bulk/', ['100', '300', ''], format='json')
+
+        self.assertEqual(response.data, [
+            {'value': '100', 'status': 'deleted'},
+            {'value': '300', 'status': 'not_found'},
+            {'value': '', 'status': 'invalid', 'errors': {'value': ['Вкажіть штрих-код.']}},
+        ])
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(OutboxEvent.objects.filter(action=OutboxEvent.ACTION_DELETED).count(), 1)
+
+
+class ParseRangeTestCase(TestCase):
+
+    def test_single_ranges(self) -> None:
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+
+    def test_open_ended_range(self) -> None:
+        self.assertEqual(parse_range('bytes=10-', 100), (10, 99))
+
+    def test_suffix_range(self) -> None:
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-200', 100), (0, 99))
+
+    def test_multiple_and_invalid_ranges_are_ignored(self) -> None:
+        for header in ('bytes=0-9,20-29', 'bytes=-', 'items=0-9', 'bytes=9-0'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 100))
+
+    def test_unsatisfiable_range(self) -> None:
+        for header, size in (('bytes=100-', 100), ('bytes=-0', 100), ('bytes=-10', 0)):
+            with self.subTest(header=header, size=size), self.assertRaises(ValueError):
+                parse_range(header, size)
+
+
+class ServeMediaTestCase(TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        os.mkdir(os.path.join(directory.name, 'photo'))
+        with open(os.path.join(directory.name, 'photo', 'a.jpg'), 'wb') as file:
+            file.write(b'0123456789')
+
+        settings_override = override_settings(MEDIA_ROOT=directory.name, MEDIA_SENDFILE_HEADER=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_file_is_served_without_database(self) -> None:
+        with self.assertNumQueries(0):
+            response = self.client.get('/media/photo/a.jpg')
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+            not_modified = self.client.get('/media/photo/a.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_ranges(self) -> None:
+        response = self.client.get('/media/photo/a.jpg', HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+
+        response = self.client.get('/media/photo/a.jpg', HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+        # range of changed file is ignored
+        response = self.client.get('/media/photo/a.jpg', HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BackfillImageMetadataTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.mkdir(os.path.join(directory.name, 'photo'))
+        PillowImage.new('RGB', (3, 2)).save(os.path.join(directory.name, 'photo', 'a.png'))
+
+        # images stored before metadata was kept
+        for value in ('100', '101', '102'):
+            product: Product = Product.objects.create(value=value, name='Product', width=1, height=2, depth=3)
+            Image.objects.create(product=product, alt='front', photo='photo/a.png', hash='hash')
+        Image.objects.create(product=product, alt='back', photo='photo/missing.png', hash='hash')
+
+    def test_verifying_fills_metadata_of_all_images(self) -> None:
+        with mock.patch.object(backfill_image_metadata, 'delay', wraps=backfill_image_metadata) as delay:
+            verify_images(batch_size=1)
+
+        # each batch queues the next one until the last empty batch
+        self.assertEqual(delay.call_count, 4)
+        self.assertFalse(Image.objects.filter(verified_at__isnull=True).exists())
+        size: int = os.path.getsize(os.path.join(settings.MEDIA_ROOT, 'photo', 'a.png'))
+        self.assertEqual(
+            list(Image.objects.order_by('alt', 'pk').values_list('size', 'width', 'height', 'mime_type')),
+            [(None, None, None, ''), *[(size, 3, 2, 'image/png')] * 3]
+        )
+        self.assertIsNone(cache.get(BACKFILL_IMAGE_METADATA_KEY))
+
+    def test_backfilling_is_queued_once(self) -> None:
+        with mock.patch.object(backfill_image_metadata, 'delay') as delay:
+            verify_images(batch_size=1)
+            verify_images(batch_size=1)
+
+        delay.assert_called_once_with(1)
@@ -1,41 +1,77 @@
+import json
+import re
+import uuid
 from typing import Type, Union
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
 from django.db.models import Model, QuerySet
+from django.http import HttpResponse, QueryDict, StreamingHttpResponse
+from django.utils.http import parse_etags
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import OpenApiParameter, extend_schema
+from kombu.exceptions import OperationalError
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from products.aggregators import BaseAggregator
+from products.aggregators import BaseAggregator, SummaryAggregator
+from products.barcodes import record_barcode_changes, split_known_values
+from products.bulk import (BaseBulkProcessor, ProductBulkCreator,
+                           ProductBulkDestroyer, ProductBulkUpdater)
+from products.caching import (get_cached_product, invalidate_products,
+                              set_cached_product)
 from products.definers import ProductDefiner
 from products.enums import ComparisonModelEnum
-from products.models import Image, Product
-from products.paginators import CustomPageNumberPagination
+from products.fieldsets import ProductFieldset
+from products.filters import ProductFilter
+from products.functions import (bump_catalog_version, filter_by_values,
+                                form_etag, get_catalog_version)
+from products.locks import (acquire_task_lock, form_task_lock_key,
+                            release_task_lock)
+from products.mixins import ReplicaReadMixin
+from products.models import Image, OutboxEvent, Product
+from products.outbox import record_event
+from products.paginators import (ComparisonCursorPagination,
+                                 CustomPageNumberPagination)
+from products.permissions import IsSuperUser
+from products.plans import (ComparisonPlan, compile_comparison_plan,
+                            get_comparison_plan)
+from products.renderers import ComparisonDiffRenderer
 from products.serializers import (ProductCreateUpdateSerializer,
                                   ProductListSerializer)
+from products.snapshots import RemoteSnapshot, get_remote_snapshot
 from products.tasks import update_certain_images, update_certain_products
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, ModelViewSet):
     serializer_class = ProductListSerializer
     pagination_class = CustomPageNumberPagination
     definer_class = ProductDefiner
     aggregator_class = BaseAggregator
+    summary_aggregator_class = SummaryAggregator
+    filter_class = ProductFilter
+    fieldset_class = ProductFieldset
+    replica_actions = ('list', 'retrieve', 'list_my_products', 'get_comparison')
     comparison_model_enum_class = ComparisonModelEnum
     lookup_field = 'value'
+    bulk_max_size = 10000
+    comparison_pagination_class = ComparisonCursorPagination
+    comparison_renderer_class = ComparisonDiffRenderer
+    # amount of rows fetched from database at once while streaming comparison
+    comparison_stream_chunk_size = 2000
 
     def get_queryset(self) -> QuerySet[Product]:
-        return Product.objects.prefetch_related('image_set').all()
+        return Product.objects.all()
 
     def get_my_queryset(self) -> QuerySet[Product]:
         return Product.objects.filter(creator=self.request.user)
 
     def get_by_value_queryset(self, model: Type[Model]) -> QuerySet[Union[Product, Image]]:
-        filtration = {self.comparison_model_enum_class.get_value_field(model) + '__in': self.value}
-        return model.objects.filter(**filtration)
+        value_field: str = self.comparison_model_enum_class.get_value_field(model)
+        return filter_by_values(model.objects.all(), value_field, self.value)
 
     def get_changed_product_querysets(self, agg: BaseAggregator) -> dict[Type[Model], QuerySet]:
         queries = {}
@@ -44,76 +80,299 @@ class ProductViewSet(ModelViewSet):
 
             # if there are any values filter it, otherwise get all records
             if self.value:
-                value_field: str = self.comparison_model_enum_class.get_value_field(model) + '__in'
-                filtering_condition = {value_field: self.value}
+                queryset: QuerySet = self.get_by_value_queryset(model)
             else:
-                filtering_condition = {}
+                queryset: QuerySet = model.objects.all()
 
-            queries[model] = model.objects.filter(**filtering_condition)\
-                .annotate(**agg.response['annotations'][model])
+            queries[model] = queryset.annotate(**agg.response['annotations'][model])
 
         return queries
 
-    def resolve_querysets_to_response(self, query_dict: dict[Type[Model], QuerySet], agg: BaseAggregator,
-                                      definer_response: dict):
-        response: dict = {}
+    def get_group_querysets(self, query_dict: dict[Type[Model], QuerySet], agg: BaseAggregator,
+                            definer_response: dict) -> dict[str, QuerySet]:
+        group_querysets: dict = {}
         for model, dct in definer_response.items():
-            for key in dct.keys():
-                auxiliary_model: Type[Model] = self.comparison_model_enum_class.get_comparison_model(model)
-                auxiliary_model_name: str = auxiliary_model.__name__.lower()
+            auxiliary_model: Type[Model] = self.comparison_model_enum_class.get_comparison_model(model)
+            auxiliary_model_name: str = auxiliary_model.__name__.lower()
 
+            for key in dct.keys():
                 # exclude from each query not changed instances
-                response[key] = query_dict[model].exclude(*agg.response['exclusions'][key])\
+                group_querysets[key] = query_dict[model].exclude(*agg.response['exclusions'][key])\
                     .values(
                         *self.comparison_model_enum_class.get_core_fields(model),
                         *dct[key],
                         *[f'{auxiliary_model_name}__{item}' for item in dct[key]]
                 )
 
-                # deleting extra fields from list of values
-                for instance in response[key]:
-                    for field_name in dct[key]:
-                        field_value = instance[field_name]
-                        related_field_name = f'{auxiliary_model_name}__{field_name}'
-                        related_field_value = instance[related_field_name]
+        return group_querysets
+
+    def get_group_field_names(self, definer_response: dict) -> dict[str, tuple[tuple, str]]:
+        """
+        Returns compared fields and name of remote model for each field group
+        """
+        field_names: dict = {}
+        for model, dct in definer_response.items():
+            auxiliary_model: Type[Model] = self.comparison_model_enum_class.get_comparison_model(model)
+            for key in dct.keys():
+                field_names[key] = (dct[key], auxiliary_model.__name__.lower())
+
+        return field_names
+
+    @staticmethod
+    def strip_unchanged_fields(instance: dict, field_names: tuple, auxiliary_model_name: str) -> dict:
+        # deleting extra fields from values
+        for field_name in field_names:
+            field_value = instance[field_name]
+            related_field_name = f'{auxiliary_model_name}__{field_name}'
+            related_field_value = instance[related_field_name]
+
+            if field_value == related_field_value:
+                del instance[field_name]
+                del instance[related_field_name]
+
+        return instance
 
-                        if field_value == related_field_value:
-                            del instance[field_name]
-                            del instance[related_field_name]
+    def resolve_querysets_to_response(self, query_dict: dict[Type[Model], QuerySet], agg: BaseAggregator,
+                                      definer_response: dict):
+        response: dict = {}
+        group_querysets: dict[str, QuerySet] = self.get_group_querysets(query_dict, agg, definer_response)
+
+        for key, (field_names, auxiliary_model_name) in self.get_group_field_names(definer_response).items():
+            response[key] = [
+                self.strip_unchanged_fields(instance, field_names, auxiliary_model_name)
+                for instance in group_querysets[key]
+            ]
+
+        return response
 
-                response[key] = list(response[key])
+    def compare_with_snapshot(self, snapshot: RemoteSnapshot, definer_response: dict) -> dict[str, list]:
+        """
+        Compares local data with memory-mapped snapshot of remote catalog instead of querying remote tables
+        """
+        response: dict = {}
+        for model, dct in definer_response.items():
+            queryset: QuerySet = self.get_by_value_queryset(model) if self.value else model.objects.all()
+
+            if model is Image:
+                images: list = list(queryset.values_list('product__value', 'alt', 'hash'))
+                for key in dct.keys():
+                    response[key] = snapshot.compare_images(images)
+            else:
+                products: list = list(queryset.values_list('value', 'name', 'width', 'height', 'depth'))
+                response.update(snapshot.compare_products(products, dct))
 
         return response
 
-    def get_object(self):
+    def paginate_comparison(self, group_querysets: dict[str, QuerySet], definer_response: dict) -> Response:
+        try:
+            paginator = self.comparison_pagination_class(self.request.query_params)
+        except ValueError:
+            return Response({'detail': _('Перевірте правильність розміру сторінки та курсора.')},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results, next_cursor = paginator.paginate(group_querysets)
+        group_field_names: dict = self.get_group_field_names(definer_response)
+        for key, rows in results.items():
+            for instance in rows:
+                self.strip_unchanged_fields(instance, *group_field_names[key])
+
+        return Response({'results': results, 'next': next_cursor}, status=status.HTTP_200_OK)
+
+    def stream_comparison(self, group_querysets: dict[str, QuerySet], definer_response: dict) -> StreamingHttpResponse:
+        """
+        Streams the same JSON as usual comparison, rows are read from database with server-side cursor
+        """
+        group_field_names: dict = self.get_group_field_names(definer_response)
+
+        # database is chosen now, as response is generated after the view has returned
+        group_querysets = {key: queryset.using(queryset.db) for key, queryset in group_querysets.items()}
+        chunk_size: int = self.comparison_stream_chunk_size
+
+        def generate_response():
+            yield '{'
+            for group_index, (key, queryset) in enumerate(group_querysets.items()):
+                yield f'{", " if group_index else ""}{json.dumps(key)}: ['
+
+                chunk: list = []
+                separator: str = ''
+                for instance in queryset.iterator(chunk_size=chunk_size):
+                    chunk.append(json.dumps(self.strip_unchanged_fields(instance, *group_field_names[key]),
+                                            cls=DjangoJSONEncoder))
+                    if len(chunk) == chunk_size:
+                        yield separator + ', '.join(chunk)
+                        separator, chunk = ', ', []
+
+                if chunk:
+                    yield separator + ', '.join(chunk)
+                yield ']'
+            yield '}'
+
+        return StreamingHttpResponse(generate_response(), content_type='application/json')
+
+    def get_object(self, queryset: QuerySet[Product] = None):
+        if queryset is None:
+            queryset = Product.objects.all()
+
         try:
-            return Product.objects.get(value=self.kwargs.get(self.lookup_field))
+            return queryset.get(value=self.kwargs.get(self.lookup_field))
         except Product.DoesNotExist:
             raise ValidationError(detail={'detail': _('Не знайдено.')})
 
-    def validate_values(self) -> None:
-        # blank value is admissible
-        try:
-            self.value: list = self.value[0].split(',')
+    def get_request_values(self, request) -> list:
+        """
+        Gets barcodes from uploaded file, request body or query params. Big sets of barcodes
+        do not fit in URL, so they could be sent in body of POST request
+        """
+        upload = request.FILES.get('file')
+        if upload:
+            return re.split(r'[\s,]+', upload.read().decode())
+
+        data = request.data
+        if isinstance(data, list):
+            return data
+
+        values: list = []
+        if isinstance(data, QueryDict):
+            values = data.getlist('value')
+        elif isinstance(data, dict) and data.get('value'):
+            values = data['value'] if isinstance(data['value'], list) else [data['value']]
+
+        return values or request.query_params.getlist('value')
+
+    def get_request_fields(self, request) -> list:
+        fields = request.data.get('fields') if isinstance(request.data, dict) else None
 
-            for value in self.value:
-                if not isinstance(value, str) and not value.isnumeric():
-                    raise ValueError()
+        if isinstance(fields, list):
+            return list(fields)
 
-        except IndexError:
-            pass
+        if fields:
+            return fields.split(',')
 
+        return request.query_params.getlist('fields')[0].split(',')
+
+    def validate_values(self) -> None:
+        # blank value is admissible, each item could contain several values separated by comma
+        self.value: list = [value.strip() for item in self.value for value in str(item).split(',') if value.strip()]
+
+    def filter_known_values(self) -> list[str]:
+        """
+        Leaves only values known both in local and remote catalog and returns unknown ones
+        """
+        if not self.value:
+            return []
+
+        self.value, unknown = split_known_values(self.value)
+        return unknown
+
+    def get_list_etag(self) -> str:
+        # full path keeps pages and page sizes apart; replica could lag behind the version, so its response
+        # gets ETag which never matches and the first revalidation is answered by primary
+        return form_etag('list', get_catalog_version(), self.request.get_full_path(),
+                         'replica' if self.uses_replica else 'primary')
+
+    def get_retrieve_etag(self, version: int) -> str:
+        return form_etag('retrieve', version, self.kwargs.get(self.lookup_field),
+                         self.request.query_params.get('fields'))
+
+    def is_not_modified(self, etag: str) -> bool:
+        if_none_match: str = self.request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+
+        # weak comparison is used for If-None-Match
+        etags: list = [item.removeprefix('W/') for item in parse_etags(if_none_match)]
+        return '*' in etags or etag in etags
+
+    @staticmethod
+    def set_etag_headers(response: Response, etag: str) -> Response:
+        response['ETag'] = etag
+        # clients are allowed to store the response, but should revalidate it on every request
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='search', location=OpenApiParameter.QUERY,
+                             description='Part of the name', required=False, type=str),
+            *[
+                OpenApiParameter(name=f'{field}_{suffix}', location=OpenApiParameter.QUERY,
+                                 description=f'{suffix.capitalize()} {field}', required=False, type=float)
+                for field in ProductFilter.range_fields for suffix in ('min', 'max')
+            ],
+            OpenApiParameter(name='ordering', location=OpenApiParameter.QUERY,
+                             description='Fields for sorting separated by comma, "-" for descending order',
+                             required=False, type=str),
+            OpenApiParameter(name='fields', location=OpenApiParameter.QUERY,
+                             description='Returned fields separated by comma', required=False, type=str),
+        ]
+    )
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
+        etag: str = self.get_list_etag()
+        if self.is_not_modified(etag):
+            return self.set_etag_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+        product_filter = self.filter_class(request.query_params)
+        if not product_filter.is_valid:
+            return Response(data=product_filter.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        fieldset = self.fieldset_class(request.query_params)
+        if not fieldset.is_valid:
+            return Response(data=fieldset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = fieldset.apply_queryset(product_filter.filter_queryset(self.get_queryset()))
         paginated_queryset = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(instance=paginated_queryset, many=True)
-        return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(instance=paginated_queryset, many=True, fields=fieldset.fields)
+        return self.set_etag_headers(self.get_paginated_response(serializer.data), etag)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='fields', location=OpenApiParameter.QUERY,
+                             description='Returned fields separated by comma', required=False, type=str),
+        ]
+    )
+    def retrieve(self, request, *args, **kwargs):
+        fieldset = self.fieldset_class(request.query_params)
+        if not fieldset.is_valid:
+            return Response(data=fieldset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # full representation is cached once and cut to requested fields for each request
+        value: str = self.kwargs.get(self.lookup_field)
+        entry: dict | None = get_cached_product(value)
+        if entry is None:
+            # version is read before product, primary is read, as lagging replica would put stale product
+            # into shared cache; cached representation does not depend on host, so photo URLs are relative in it
+            version: int = get_catalog_version()
+            instance: Product = self.get_object(Product.objects.using('default'))
+            entry = set_cached_product(value, self.get_serializer(instance=instance, context={}).data, version)
+
+        # ETag is formed from the same entry as body, so stale body never gets fresh ETag
+        etag: str = self.get_retrieve_etag(entry['version'])
+        if self.is_not_modified(etag):
+            return self.set_etag_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+        data: dict = fieldset.shrink(entry['data'])
+        return self.set_etag_headers(Response(self.build_photo_urls(data), status=status.HTTP_200_OK), etag)
+
+    def build_photo_urls(self, data: dict) -> dict:
+        if 'images' not in data:
+            return data
+
+        return {
+            **data,
+            'images': [
+                {**image, 'photo': self.request.build_absolute_uri(image['photo']) if image['photo'] else None}
+                for image in data['images']
+            ]
+        }
 
     def create(self, request, *args, **kwargs):
         self.serializer_class = ProductCreateUpdateSerializer
         serializer = self.get_serializer(data=request.data, context={'user': request.user})
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                product: Product = serializer.save()
+                record_event(product, OutboxEvent.ACTION_CREATED)
+            bump_catalog_version()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -121,54 +380,186 @@ class ProductViewSet(ModelViewSet):
         self.serializer_class = ProductCreateUpdateSerializer
         serializer = self.get_serializer(data=request.data, instance=self.get_object(), partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                product: Product = serializer.save()
+                record_event(product, OutboxEvent.ACTION_UPDATED, serializer.validated_data.keys())
+            bump_catalog_version()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def destroy(self, request, *args, **kwargs):
         obj: Product = self.get_object()
-        obj.delete()
+        with transaction.atomic():
+            record_event(obj, OutboxEvent.ACTION_DELETED)
+            obj.delete()
+            invalidate_products((obj.value,))
+            record_barcode_changes(removed=(obj.value,))
+        bump_catalog_version()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def process_bulk(self, processor_class: Type[BaseBulkProcessor], request) -> Response:
+        if not isinstance(request.data, list):
+            return Response({'detail': _('Очікується список товарів.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(request.data) > self.bulk_max_size:
+            return Response({'detail': _('Перевищено максимальну кількість товарів у запиті.')},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        processor = processor_class(request.data, user=request.user)
+        processor.process()
+        bump_catalog_version()
+        return Response(processor.response, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        return self.process_bulk(ProductBulkCreator, request)
+
+    @bulk_create.mapping.patch
+    def bulk_partial_update(self, request, *args, **kwargs):
+        return self.process_bulk(ProductBulkUpdater, request)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        return self.process_bulk(ProductBulkDestroyer, request)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='fields', location=OpenApiParameter.QUERY,
+                             description='Returned fields separated by comma', required=False, type=str),
+        ]
+    )
     @action(methods=['GET'], detail=False, url_path='my')
     def list_my_products(self, request, *args, **kwargs):
-        queryset = self.get_my_queryset()
+        fieldset = self.fieldset_class(request.query_params)
+        if not fieldset.is_valid:
+            return Response(data=fieldset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = fieldset.apply_queryset(self.get_my_queryset())
         paginated_queryset = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(instance=paginated_queryset, many=True)
+        serializer = self.get_serializer(instance=paginated_queryset, many=True, fields=fieldset.fields)
         return self.get_paginated_response(serializer.data)
 
     @extend_schema(
         parameters=[
             OpenApiParameter(name='value', location=OpenApiParameter.QUERY,
-                             description='Values', required=False, type=str),
+                             description='Values, big sets of values should be sent in body of POST request',
+                             required=False, type=str),
             OpenApiParameter(name='fields', location=OpenApiParameter.QUERY,
                              description='Number of the page of the queryset that will be returned', required=True,
-                             type=str)
+                             type=str),
+            OpenApiParameter(name='page_size', location=OpenApiParameter.QUERY,
+                             description='Size of page of each field group, enables cursor pagination',
+                             required=False, type=int),
+            OpenApiParameter(name='cursor', location=OpenApiParameter.QUERY,
+                             description='Cursor of the next page', required=False, type=str),
+            OpenApiParameter(name='stream', location=OpenApiParameter.QUERY,
+                             description='Stream the whole comparison if "true"', required=False, type=str),
+            OpenApiParameter(name='source', location=OpenApiParameter.QUERY,
+                             description='"snapshot" to compare with memory-mapped snapshot of remote catalog',
+                             required=False, type=str),
+            OpenApiParameter(name='summary', location=OpenApiParameter.QUERY,
+                             description='Return only amount of changed products for each field group if "true"',
+                             required=False, type=str),
+            OpenApiParameter(name='samples', location=OpenApiParameter.QUERY,
+                             description='Amount of sample values for each field group in summary',
+                             required=False, type=int)
         ]
     )
-    @action(methods=['GET'], detail=False, url_path='compare')
+    @action(methods=['GET', 'POST'], detail=False, url_path='compare')
     def get_comparison(self, request, *args, **kwargs):
         try:
-            self.value = request.query_params.getlist('value')
+            self.value = self.get_request_values(request)
             self.validate_values()
-            fields = request.query_params.getlist('fields')[0].split(',')
+            fields = self.get_request_fields(request)
             fields.sort()
-        except (IndexError, AttributeError, ValueError):
+        except (IndexError, AttributeError, TypeError, ValueError):
             return Response({'detail': _('Перевірте правильність введених штрих-кодів та полів.')})
 
-        definer = self.definer_class(fields)
-        if definer.is_valid:
-            definer_response: dict = definer.response
-            agg = self.aggregator_class(definer_response)
-            query_dict = self.get_changed_product_querysets(agg)
-            response = self.resolve_querysets_to_response(query_dict, agg, definer_response)
-            return Response(response, status=status.HTTP_200_OK)
-        else:
-            return Response(data=definer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # unknown barcodes are rejected before any comparison query is built
+        unknown: list = self.filter_known_values()
+        if unknown:
+            return Response({'detail': _('Товари з такими штрих-кодами не знайдено.'), 'unknown': unknown},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            plan: ComparisonPlan = get_comparison_plan(fields, self.definer_class, self.aggregator_class)
+        except KeyError as error:
+            return Response(data=error.args[0], status=status.HTTP_400_BAD_REQUEST)
+
+        if request.query_params.get('summary') == 'true':
+            try:
+                samples: int = int(request.query_params.get('samples', 0))
+            except ValueError:
+                return Response({'detail': _('Вкажіть число.')}, status=status.HTTP_400_BAD_REQUEST)
+
+            groups: list = [key for dct in plan.definer_response.values() for key in dct.keys()]
+            summary = self.summary_aggregator_class(groups, self.value, samples)
+            return Response(summary.response, status=status.HTTP_200_OK)
+
+        if request.query_params.get('source') == 'snapshot':
+            snapshot: RemoteSnapshot = get_remote_snapshot()
+
+            # comparison is performed with database if snapshot has not been written yet
+            if snapshot:
+                return Response(self.compare_with_snapshot(snapshot, plan.definer_response), status=status.HTTP_200_OK)
+
+        query_dict = self.get_changed_product_querysets(plan.aggregator)
+        group_querysets = self.get_group_querysets(query_dict, plan.aggregator, plan.definer_response)
+
+        if request.query_params.get('stream') == 'true':
+            return self.stream_comparison(group_querysets, plan.definer_response)
+
+        if self.comparison_pagination_class.page_size_query_param in request.query_params:
+            return self.paginate_comparison(group_querysets, plan.definer_response)
+
+        # database builds diffs of rows itself where it is able to, so its JSON is returned as is
+        renderer = self.comparison_renderer_class(group_querysets, self.get_group_field_names(plan.definer_response))
+        if renderer.is_supported:
+            return HttpResponse(renderer.render(), content_type='application/json', status=status.HTTP_200_OK)
+
+        response = self.resolve_querysets_to_response(query_dict, plan.aggregator, plan.definer_response)
+        return Response(response, status=status.HTTP_200_OK)
 
     @extend_schema(
         parameters=[
-            OpenApiParameter(name='value', location=OpenApiParameter.QUERY, description='Values',
+            OpenApiParameter(name='value', location=OpenApiParameter.QUERY,
+                             description='Values', required=False, type=str),
+            OpenApiParameter(name='fields', location=OpenApiParameter.QUERY,
+                             description='Fields for comparison', required=True, type=str)
+        ]
+    )
+    @action(methods=['GET'], detail=False, url_path='compare/plan', permission_classes=[IsSuperUser])
+    def get_comparison_plan(self, request, *args, **kwargs):
+        """
+        Shows SQL and EXPLAIN output of compiled comparison plan for each field group
+        """
+        try:
+            self.value = self.get_request_values(request)
+            self.validate_values()
+            plan: ComparisonPlan = get_comparison_plan(self.get_request_fields(request), self.definer_class,
+                                                       self.aggregator_class)
+        except (IndexError, AttributeError, TypeError, ValueError):
+            return Response({'detail': _('Перевірте правильність введених штрих-кодів та полів.')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except KeyError as error:
+            return Response(data=error.args[0], status=status.HTTP_400_BAD_REQUEST)
+
+        query_dict = self.get_changed_product_querysets(plan.aggregator)
+        group_querysets = self.get_group_querysets(query_dict, plan.aggregator, plan.definer_response)
+
+        return Response({
+            'fields': plan.fields,
+            'groups': {
+                key: {'sql': str(queryset.query), 'explain': queryset.explain()}
+                for key, queryset in group_querysets.items()
+            },
+            'cache': compile_comparison_plan.cache_info()._asdict()
+        }, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='value', location=OpenApiParameter.QUERY,
+                             description='Values, big sets of values could be sent in body or as uploaded file',
                              required=False, type=str),
             OpenApiParameter(name='fields', location=OpenApiParameter.QUERY,
                              description='Number of the page of the queryset that will be returned', required=True,
@@ -178,31 +569,57 @@ class ProductViewSet(ModelViewSet):
     @action(methods=['POST'], detail=False, url_path='synchronize')
     def synchronize_products_and_images(self, request, *args, **kwargs):
         try:
-            self.value = request.query_params.getlist('value')
+            self.value = self.get_request_values(request)
             self.validate_values()
-            fields: list = request.query_params.getlist('fields')[0].split(',')
+            fields: list = self.get_request_fields(request)
             fields.sort()
-        except (IndexError, AttributeError, ValueError):
+        except (IndexError, AttributeError, TypeError, ValueError):
             return Response({'detail': _('Перевірте правильність вибраних штрих-кодів та полів.')})
 
-        definer = self.definer_class(fields)
-        if definer.is_valid:
+        # unknown barcodes are skipped, so no job is queued for them;
+        # empty list of values means the whole catalog, so request with only unknown values is rejected
+        unknown: list = self.filter_known_values()
+        if unknown and not self.value:
+            return Response({'detail': _('Товари з такими штрих-кодами не знайдено.'), 'unknown': unknown},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-            task_for_updating = {
-                Product: update_certain_products,
-                Image: update_certain_images
-            }
-
-            definer_response: dict = definer.response
-
-            # set null fields for Image in order to perform update of all fields
-            if Image in definer_response.keys():
-                definer_response[Image] = {}
-
-            for model in definer_response.keys():
-                fields = [field for field_tuple in definer_response[model].values() for field in field_tuple]
-                task_for_updating[model].delay(self.value, fields)
-
-            return Response(data={'detail': _('Успішно оновлено.')}, status=status.HTTP_200_OK)
-        else:
-            return Response(data=definer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            plan: ComparisonPlan = get_comparison_plan(fields, self.definer_class, self.aggregator_class)
+        except KeyError as error:
+            return Response(data=error.args[0], status=status.HTTP_400_BAD_REQUEST)
+
+        task_for_updating = {
+            Product: update_certain_products,
+            Image: update_certain_images
+        }
+
+        # copying, as compiled plan is shared between requests
+        definer_response: dict = dict(plan.definer_response)
+
+        # set null fields for Image in order to perform update of all fields
+        if Image in definer_response.keys():
+            definer_response[Image] = {}
+
+        tasks: dict = {}
+        for model in definer_response.keys():
+            fields = [field for field_tuple in definer_response[model].values() for field in field_tuple]
+
+            # the same job which is already queued or running is not queued once again
+            task_id: str = str(uuid.uuid4())
+            lock_key: str = form_task_lock_key(model, self.value, fields)
+            lock_holder: str = acquire_task_lock(lock_key, task_id)
+            if lock_holder == task_id:
+                try:
+                    task_for_updating[model].apply_async((self.value, fields), task_id=task_id)
+                except Exception as error:
+                    # job was not queued, so the same request could be repeated instead of attaching to nothing
+                    release_task_lock(lock_key, task_id)
+                    if not isinstance(error, OperationalError):
+                        raise
+                    return Response({'detail': _('Не вдалося поставити оновлення в чергу, спробуйте пізніше.')},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+            tasks[model.__name__.lower()] = {'id': lock_holder, 'attached': lock_holder != task_id}
+
+        return Response(data={'detail': _('Успішно оновлено.'), 'tasks': tasks, 'unknown': unknown},
+                        status=status.HTTP_200_OK)
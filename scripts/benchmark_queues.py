@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from django.core.cache import cache
+
+from product_project import app
+
+# queue which serves all tasks in single queue layout
+SINGLE_QUEUE = 'db'
+
+# counter of finished tasks of single run
+BENCHMARK_COUNTER_KEY = 'products:benchmark-queues:{run_id}'
+
+
+@app.task()
+def benchmark_image_task(run_id: str, latency: float) -> None:
+    """
+    Imitates downloading and hashing of photo, routed to I/O queue
+    """
+    time.sleep(latency)
+    hashlib.md5(os.urandom(64 * 1024)).hexdigest()
+    cache.incr(BENCHMARK_COUNTER_KEY.format(run_id=run_id))
+
+
+@app.task()
+def benchmark_product_task(run_id: str, duration: float) -> None:
+    """
+    Imitates short DB-bound update of product
+    """
+    time.sleep(duration)
+    cache.incr(BENCHMARK_COUNTER_KEY.format(run_id=run_id))
+
+
+def check_workers() -> None:
+    # tasks are executed by real workers, so both queues have to be consumed
+    active_queues: dict = app.control.inspect().active_queues() or {}
+    consumed: set = {queue['name'] for queues in active_queues.values() for queue in queues}
+    missing: set = {'db', 'io'} - consumed
+    if missing:
+        raise RuntimeError(f'No worker consumes queues: {", ".join(sorted(missing))}. '
+                           f'Start them with "pipenv run worker-db" and "pipenv run worker-io".')
+
+
+def measure(images: int, products: int, latency: float, duration: float, queue: str | None,
+            timeout: float) -> dict:
+    """
+    Queues image and product tasks interleaved and waits until workers finish them. Tasks go to
+    indicated queue, or to queues of CELERY_TASK_ROUTES if queue is None
+    """
+    run_ids: dict = {'images': uuid.uuid4().hex, 'products': uuid.uuid4().hex}
+    totals: dict = {'images': images, 'products': products}
+    for run_id in run_ids.values():
+        cache.set(BENCHMARK_COUNTER_KEY.format(run_id=run_id), 0, timeout * 2)
+
+    options: dict = {'queue': queue} if queue else {}
+    started = time.perf_counter()
+    for index in range(max(images, products)):
+        if index < images:
+            benchmark_image_task.apply_async((run_ids['images'], latency), **options)
+        if index < products:
+            benchmark_product_task.apply_async((run_ids['products'], duration), **options)
+
+    finished: dict = {}
+    while len(finished) < len(run_ids):
+        elapsed: float = time.perf_counter() - started
+        if elapsed > timeout:
+            raise RuntimeError(f'Tasks were not finished in {timeout} seconds.')
+
+        for kind, run_id in run_ids.items():
+            if kind not in finished and cache.get(BENCHMARK_COUNTER_KEY.format(run_id=run_id), 0) >= totals[kind]:
+                finished[kind] = round(elapsed, 3)
+        time.sleep(0.05)
+
+    seconds: float = max(finished.values())
+    return {
+        'seconds': seconds,
+        'tasks_per_second': round((images + products) / seconds, 1),
+        'images_seconds': finished['images'],
+        'products_seconds': finished['products'],
+    }
+
+
+def run(*args) -> None:
+    """
+    Compares throughput of single shared prefork queue with separate 'db' and 'io' queues. Tasks are sent
+    to running workers, so both layouts are measured with real routing, pools and prefetch settings.
+    The shared cache has to be the same for script and workers, as finished tasks are counted in it.
+
+    python manage.py runscript benchmark_queues --script-args <images> <products> <image latency> <timeout>
+    """
+    images, products, latency, timeout = 200, 200, 0.1, 600
+    if args:
+        images, products, latency, timeout = int(args[0]), int(args[1]), float(args[2]), float(args[3])
+
+    product_duration: float = 0.005
+    check_workers()
+
+    print('Measuring single queue...')
+    single_queue: dict = measure(images, products, latency, product_duration, SINGLE_QUEUE, timeout)
+
+    print('Measuring separate queues...')
+    separate_queues: dict = measure(images, products, latency, product_duration, None, timeout)
+
+    print(json.dumps({
+        'tasks': images + products,
+        'image_latency': latency,
+        'single_queue': single_queue,
+        'separate_queues': separate_queues,
+        'speedup': round(single_queue['seconds'] / separate_queues['seconds'], 2),
+    }, indent=4))
@@ -1,8 +1,120 @@
-from products.models import Image, Product
+from typing import Iterator
 
+from django.db import connection, transaction
 
-def run() -> None:
+from products.barcodes import clear_barcode_index
+from products.caching import invalidate_products
+from products.functions import bump_catalog_version
+from products.models import (Image, ImageRemote, OutboxEvent, Product,
+                             ProductRemote)
+from products.snapshots import write_remote_snapshot
+from products.tasks import MEDIA_DELETE_BATCH_SIZE, delete_media_files
+
+# images go first, so rows are removed before rows they reference
+CATALOG_MODELS: tuple = (Image, ImageRemote, Product, ProductRemote)
+
+# temporary tables which keep values of removed products and names of their photos until they are processed
+REMOVED_VALUES_TABLE = 'clear_db_removed_values'
+REMOVED_PHOTOS_TABLE = 'clear_db_removed_photos'
+
+
+def stage_removed_rows(cursor, photos: bool = True) -> None:
+    """
+    Copies values and photo names into temporary tables inside database, so they are not loaded into memory
+    and stay readable after catalog tables are emptied in the same session
+    """
+    quote_name = connection.ops.quote_name
+    for table in (REMOVED_VALUES_TABLE, REMOVED_PHOTOS_TABLE):
+        cursor.execute(f'DROP TABLE IF EXISTS {quote_name(table)}')
+
+    cursor.execute(f'CREATE TEMPORARY TABLE {quote_name(REMOVED_VALUES_TABLE)} AS '
+                   f'SELECT {quote_name("value")} FROM {quote_name(Product._meta.db_table)}')
+    if photos:
+        photos_query: str = ' UNION '.join(
+            f'SELECT {quote_name("photo")} FROM {quote_name(model._meta.db_table)} '
+            f'WHERE {quote_name("photo")} <> \'\''
+            for model in (Image, ImageRemote)
+        )
+        cursor.execute(f'CREATE TEMPORARY TABLE {quote_name(REMOVED_PHOTOS_TABLE)} AS {photos_query}')
+
+
+def read_removed_rows(table: str) -> Iterator[list[str]]:
+    """
+    Streams staged table in batches with server-side cursor and drops it afterwards
+    """
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(f'SELECT * FROM {connection.ops.quote_name(table)}')
+        while rows := cursor.fetchmany(MEDIA_DELETE_BATCH_SIZE):
+            yield [row[0] for row in rows]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {connection.ops.quote_name(table)}')
+
+
+def record_all_products_deleted() -> None:
+    # the whole catalog is removed with single event instead of event for each product
+    OutboxEvent.objects.create(model=Product._meta.model_name, action=OutboxEvent.ACTION_DELETED,
+                               payload={'all': True})
+
+
+def truncate_catalog(photos: bool = True) -> None:
+    """
+    Removes all products and images of local and remote catalog without loading them into memory,
+    their values and photos are staged for processing after removal
+    """
+    tables: list = [connection.ops.quote_name(model._meta.db_table) for model in CATALOG_MODELS]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        stage_removed_rows(cursor, photos)
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'TRUNCATE TABLE {", ".join(tables)} RESTART IDENTITY')
+        else:
+            for table in tables:
+                cursor.execute(f'DELETE FROM {table}')
+
+        record_all_products_deleted()
+
+
+def invalidate_removed_products() -> None:
+    """
+    Removes cached products and index of barcodes built from removed catalog
+    """
+    bump_catalog_version()
+    for values in read_removed_rows(REMOVED_VALUES_TABLE):
+        invalidate_products(values)
+    clear_barcode_index()
+
+
+def run(*args) -> None:
+    """
+    python manage.py runscript clear_db --script-args fast
+
+    'fast' mode truncates tables and queues removal of photos, otherwise rows are deleted one by one
+    """
     print('Starting database clearing...')
-    Product.objects.all().delete()
-    Image.objects.all().delete()
-    print('Successfully deleted...')
+
+    if 'fast' not in args:
+        # photos are not removed in this mode
+        with transaction.atomic(), connection.cursor() as cursor:
+            stage_removed_rows(cursor, photos=False)
+            Product.objects.all().delete()
+            Image.objects.all().delete()
+
+            # deleting querysets sends no signals, so removal is recorded as in 'fast' mode
+            record_all_products_deleted()
+
+        invalidate_removed_products()
+        print('Successfully deleted...')
+        return
+
+    truncate_catalog()
+    invalidate_removed_products()
+    # remote catalog is emptied as well, so comparisons do not use its old snapshot
+    write_remote_snapshot([], [])
+    print('Successfully truncated...')
+
+    photos_count: int = 0
+    for names in read_removed_rows(REMOVED_PHOTOS_TABLE):
+        delete_media_files.delay(names)
+        photos_count += len(names)
+    print(f'Queued removing of {photos_count} photos...')
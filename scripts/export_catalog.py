@@ -0,0 +1,21 @@
+import json
+import time
+
+from products.parquet import export_catalog
+
+
+def run(*args) -> None:
+    """
+    python manage.py runscript export_catalog --script-args <directory> <rows per file>
+    """
+    directory, chunk_size = 'catalog-export', 100000
+    if args:
+        directory = args[0]
+        chunk_size = int(args[1]) if len(args) > 1 else chunk_size
+
+    print(f'Exporting catalog to {directory}...')
+    started = time.perf_counter()
+    manifest: dict = export_catalog(directory, chunk_size)
+
+    rows: dict = {name: description['rows'] for name, description in manifest['models'].items()}
+    print(f'Successfully exported in {time.perf_counter() - started:.1f}s: {json.dumps(rows)}')
@@ -6,7 +6,7 @@ import requests
 from django.core.files import File
 
 from product_project.settings import AUTH_TOKEN
-from products.functions import get_image_base64md5
+from products.functions import get_image_base64md5, read_image_metadata
 from products.models import Image, Product
 
 
@@ -78,6 +78,7 @@ def run():
             alt=row['alt'],
             hash=image_hash
         )
+        img_to_save.set_metadata(read_image_metadata(image_io))
         img_to_save.photo.save(f'image-{row["product"]}.jpg', File(image_io))
 
     print('Creating images...')
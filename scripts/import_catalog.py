@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.db import transaction
+
+from products.barcodes import bump_barcode_index_version
+from products.functions import bump_catalog_version
+from products.models import OutboxEvent, Product
+from products.parquet import (CATALOG_MODELS, check_foreign_keys,
+                              import_catalog, read_manifest)
+from products.snapshots import write_remote_snapshot_from_database
+from scripts.clear_db import invalidate_removed_products, truncate_catalog
+from users.models import User
+
+
+def run(*args) -> None:
+    """
+    python manage.py runscript import_catalog --script-args <directory> [replace] [creator=<email>]
+
+    Catalog is imported into empty tables only, 'replace' truncates existing catalog beforehand.
+    Creators of products are kept only if they exist in this database, otherwise 'creator=<email>' assigns
+    all products to indicated user and empty 'creator=' leaves them without creator.
+    Files of photos are not part of export and have to be copied separately
+    """
+    directory: str = args[0] if args else 'catalog-export'
+
+    overrides: dict = {}
+    creator: str | None = next((arg.split('=', 1)[1] for arg in args if arg.startswith('creator=')), None)
+    if creator:
+        user: User | None = User.objects.filter(email=User.objects.normalize_email(creator)).first()
+        if user is None:
+            print(f'User {creator} does not exist.')
+            return
+        overrides['creator_id'] = user.pk
+    elif creator is not None:
+        overrides['creator_id'] = None
+
+    # references are checked before existing catalog is truncated
+    try:
+        check_foreign_keys(directory, read_manifest(directory), overrides)
+    except ValueError as error:
+        print(f'Catalog was not imported: {error}. Run with "creator=<email>" to assign products to existing user '
+              f'or with "creator=" to leave them without creator.')
+        return
+
+    replace: bool = any(model.objects.exists() for model in CATALOG_MODELS)
+    if replace and 'replace' not in args:
+        print('Catalog is not empty, run with "replace" to truncate it before importing.')
+        return
+
+    print(f'Importing catalog from {directory}...')
+    started = time.perf_counter()
+
+    # existing catalog is truncated in the same transaction, so it stays in place if import fails;
+    # on PostgreSQL TRUNCATE locks tables until import is committed
+    with transaction.atomic():
+        if replace:
+            truncate_catalog(photos=False)
+        rows: dict = import_catalog(directory, batch_size=50000, overrides=overrides)
+
+        # rows were written without signals, so everything derived from catalog is refreshed at once
+        OutboxEvent.objects.create(model=Product._meta.model_name, action=OutboxEvent.ACTION_CREATED,
+                                   payload={'all': True})
+
+    if replace:
+        invalidate_removed_products()
+    bump_catalog_version()
+    bump_barcode_index_version()
+    write_remote_snapshot_from_database()
+
+    print(f'Successfully imported in {time.perf_counter() - started:.1f}s: {json.dumps(rows)}')
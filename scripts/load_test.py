@@ -0,0 +1,215 @@
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from products.models import Product, ProductRemote
+from products.paginators import CustomPageNumberPagination
+from users.models import User
+
+# prefix of values of seeded products, so they are not mixed with real catalog
+VALUE_PREFIX = 'load-'
+
+LOAD_USER_EMAIL = 'load-test@example.com'
+
+# relative weights of endpoints in generated traffic
+TRAFFIC_MIX: dict[str, int] = {
+    'list': 30,
+    'retrieve': 30,
+    'compare': 15,
+    'my': 10,
+    'create': 5,
+    'partial_update': 10,
+}
+
+
+def check_environment() -> None:
+    """
+    Harness creates and removes data, so it refuses to run unless LOAD_TEST settings point it
+    to dedicated database and cache
+    """
+    if not settings.LOAD_TEST:
+        raise RuntimeError('Run with LOAD_TEST=1, so harness and server use dedicated database and cache.')
+
+    if not settings.LOAD_TEST_DB_NAME or settings.LOAD_TEST_DB_NAME == os.getenv('DB_NAME'):
+        raise RuntimeError('Set LOAD_TEST_DB_NAME to dedicated database, load test does not touch working one.')
+
+
+def is_debug_server(base_url: str) -> bool:
+    # technical 404 page is rendered only with DEBUG turned on
+    response = requests.get(f'{base_url}/load-test-missing-page/')
+    return response.status_code == 404 and 'URLconf' in response.text
+
+
+def seed_catalog(products: int) -> tuple[User, str, list[str]]:
+    """
+    Creates synthetic local and remote catalog, every tenth remote product differs from local one
+    """
+    clear_catalog()
+
+    user = User.objects.create_user(LOAD_USER_EMAIL, uuid.uuid4().hex, name='Load', surname='Test')
+    token: Token = Token.objects.create(user=user)
+
+    values: list[str] = [f'{VALUE_PREFIX}{index:08d}' for index in range(products)]
+    Product.objects.bulk_create([
+        Product(value=value, name=f'Product {index}', width=1 + index % 7, height=1 + index % 5,
+                depth=1 + index % 3, creator=user if index % 2 else None)
+        for index, value in enumerate(values)
+    ], batch_size=1000)
+    ProductRemote.objects.bulk_create([
+        ProductRemote(value=value, name=f'Product {index}{" new" if index % 10 == 0 else ""}',
+                      width=1 + index % 7, height=1 + index % 5, depth=1 + index % 3 + (index % 20 == 0))
+        for index, value in enumerate(values)
+    ], batch_size=1000)
+
+    return user, token.key, values
+
+
+def clear_catalog() -> None:
+    Product.objects.filter(value__startswith=VALUE_PREFIX).delete()
+    ProductRemote.objects.filter(value__startswith=VALUE_PREFIX).delete()
+    User.objects.filter(email=LOAD_USER_EMAIL).delete()
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f'Server did not start on port {port}')
+
+
+def percentile(latencies: list[float], rank: float) -> float:
+    # nearest-rank percentile of sorted latencies
+    index = max(0, min(len(latencies) - 1, round(rank / 100 * len(latencies) + 0.5) - 1))
+    return latencies[index]
+
+
+class TrafficGenerator:
+    """
+    Sends single request of randomly chosen endpoint, each thread keeps its own HTTP session
+    """
+
+    def __init__(self, base_url: str, token: str, values: list[str], my_values: list[str]) -> None:
+        self.base_url: str = base_url
+        self.token: str = token
+        self.values: list[str] = values
+        self.my_values: list[str] = my_values
+        self.pages: int = max(1, -(-len(values) // CustomPageNumberPagination.page_size))
+        self.local = threading.local()
+
+        self.endpoints: list[str] = list(TRAFFIC_MIX.keys())
+        self.weights: list[int] = list(TRAFFIC_MIX.values())
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.headers['Authorization'] = f'Token {self.token}'
+        return self.local.session
+
+    def send(self, endpoint: str) -> requests.Response:
+        url = f'{self.base_url}/product/'
+        if endpoint == 'list':
+            return self.session.get(url, params={'page': random.randint(1, self.pages)})
+        if endpoint == 'retrieve':
+            return self.session.get(f'{url}{random.choice(self.values)}/')
+        if endpoint == 'compare':
+            return self.session.get(f'{url}compare/', params={
+                'fields': 'name,size', 'value': ','.join(random.sample(self.values, min(50, len(self.values))))
+            })
+        if endpoint == 'my':
+            return self.session.get(f'{url}my/')
+        if endpoint == 'create':
+            return self.session.post(url, json={
+                'value': f'{VALUE_PREFIX}{uuid.uuid4().hex}', 'name': 'Created product',
+                'width': 1, 'height': 1, 'depth': 1
+            })
+        return self.session.patch(f'{url}{random.choice(self.my_values)}/', json={'name': f'Renamed {time.time()}'})
+
+    def __call__(self, _) -> tuple[str, float, bool]:
+        endpoint: str = random.choices(self.endpoints, self.weights)[0]
+        started = time.perf_counter()
+        try:
+            ok: bool = self.send(endpoint).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return endpoint, time.perf_counter() - started, ok
+
+
+def form_report(results: list[tuple[str, float, bool]], duration: float) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    for endpoint, latency, ok in results:
+        latencies[endpoint].append(latency)
+        errors[endpoint] += not ok
+
+    report: dict = {'duration': round(duration, 3), 'requests': len(results),
+                    'throughput': round(len(results) / duration, 2), 'endpoints': {}}
+    for endpoint, values in sorted(latencies.items()):
+        values.sort()
+        report['endpoints'][endpoint] = {
+            'requests': len(values),
+            'errors': errors[endpoint],
+            'throughput': round(len(values) / duration, 2),
+            **{f'p{rank}_ms': round(percentile(values, rank) * 1000, 2) for rank in (50, 95, 99)},
+        }
+    return report
+
+
+def run(*args) -> None:
+    """
+    Seeds synthetic catalog in dedicated database, starts server and drives mixed traffic against it.
+    Prints throughput and latency percentiles of each endpoint as JSON. Server is started with
+    LOAD_TEST_SERVER_COMMAND, which runs the application as in production by default.
+
+    LOAD_TEST=1 LOAD_TEST_DB_NAME=<database> [LOAD_TEST_REDIS_URL=<redis>] python manage.py runscript load_test \
+        --script-args <requests> <concurrency> <products> <port>
+    """
+    total, concurrency, products, port = 2000, 20, 5000, 8765
+    if args:
+        total, concurrency, products, port = int(args[0]), int(args[1]), int(args[2]), int(args[3])
+
+    check_environment()
+    # server inherits LOAD_TEST settings through environment
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput'], check=True, stdout=subprocess.DEVNULL)
+
+    user, token, values = seed_catalog(products)
+    my_values: list[str] = list(
+        Product.objects.filter(creator=user).values_list('value', flat=True)
+    )
+
+    command: str = settings.LOAD_TEST_SERVER_COMMAND.format(port=port, workers=settings.LOAD_TEST_SERVER_WORKERS)
+    server = subprocess.Popen(shlex.split(command), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        base_url: str = f'http://127.0.0.1:{port}'
+        debug: bool = is_debug_server(base_url)
+        generator = TrafficGenerator(base_url, token, values, my_values)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results: list = list(executor.map(generator, range(total)))
+        duration: float = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+        clear_catalog()
+
+    report: dict = form_report(results, duration)
+    report.update({'concurrency': concurrency, 'products': products, 'debug': debug, 'server': command})
+    print(json.dumps(report, indent=2))
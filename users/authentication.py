@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from product_project.local_cache import LocalCache
+from users.models import User
+
+TOKEN_CACHE_KEY = 'auth-token:{key}'
+
+# process-local cache of resolved tokens, it is cleared by signals only in the process which handled them
+local_tokens = LocalCache('AUTH_TOKEN_LOCAL_CACHE_SECONDS', 'AUTH_TOKEN_LOCAL_CACHE_SIZE')
+
+
+def form_token_cache_key(key: str) -> str:
+    return TOKEN_CACHE_KEY.format(key=key)
+
+
+def invalidate_token(key: str) -> None:
+    """
+    Removes resolution of token from both process-local and shared cache
+    """
+    local_tokens.delete(key)
+    cache.delete(form_token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication which keeps token to user resolution in process memory and in shared cache
+    instead of querying Token and User on every request. Only primary key and activity of user are cached,
+    other fields of user are deferred and loaded only if they are used
+    """
+
+    def resolve_token(self, key: str) -> dict:
+        model = self.get_model()
+        try:
+            user_id, is_active = model.objects.filter(key=key).values_list('user_id', 'user__is_active').get()
+        except model.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+
+        return {'user_id': user_id, 'is_active': is_active}
+
+    def authenticate_credentials(self, key: str) -> tuple:
+        now: float = time.monotonic()
+        resolution: dict | None = local_tokens.get(key, now)
+
+        if resolution is None:
+            resolution = cache.get(form_token_cache_key(key))
+            if resolution is None:
+                resolution = self.resolve_token(key)
+                cache.set(form_token_cache_key(key), resolution, settings.AUTH_TOKEN_CACHE_SECONDS)
+
+            local_tokens.set(key, resolution, now)
+
+        if not resolution['is_active']:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        user: User = User.from_db('default', ['id', 'is_active'], [resolution['user_id'], True])
+        token = self.get_model().from_db('default', ['key', 'user_id'], [key, user.pk])
+        token.user = user
+        return user, token